@@ -0,0 +1,153 @@
+"""Persistent on-disk cache for downloaded images and their thumbnails.
+
+Entries are content-addressed by the MD5 prefix the CIA release embeds in
+every ``original_file_name``/``full_url`` (``<HASH>_<name>``), so the same
+file is stored once no matter which page or session asked for it.  Writes go
+through a temporary file and ``os.replace`` so concurrent sessions never see
+a partial entry, and the cache is kept under a size budget by evicting the
+least recently used files (reads bump the file's mtime).
+"""
+import hashlib
+import os
+import re
+import tempfile
+import threading
+from pathlib import Path
+from urllib.parse import unquote
+
+from .metrics import count
+
+CACHE_DIR = Path(os.environ.get("ABBOTTABAD_CACHE_DIR", Path.cwd() / ".cache"))
+CACHE_MAX_BYTES = int(os.environ.get("ABBOTTABAD_CACHE_MB", "2048")) * 1024 * 1024
+
+ORIGINALS = "originals"
+THUMBNAILS = "thumbnails"
+
+# Eviction trims down to this fraction of the budget to avoid evicting on every write
+EVICT_TARGET = 0.9
+
+# The release's MD5 prefix, followed by "_<name>" or directly by the extension
+_HASH_PREFIX = re.compile(r"([0-9A-Fa-f]{32})(?=[_.])")
+_TMP_PREFIX = ".tmp-"
+
+
+def cache_key(url_or_name):
+    """Return the content hash embedded in a release file name or URL.
+
+    Only the file name counts, so a row's ``full_url`` and its
+    ``original_file_name`` always give the same key.  Falls back to a SHA-256
+    of the file name for names without the prefix.
+    """
+    name = unquote(str(url_or_name).rsplit("/", 1)[-1])
+    match = _HASH_PREFIX.match(name)
+    if match:
+        return match.group(1).upper()
+    return hashlib.sha256(name.encode("utf-8")).hexdigest()
+
+
+class DiskCache:
+    """Size-bounded LRU byte store split into namespaces (e.g. originals, thumbnails)."""
+
+    def __init__(self, root=CACHE_DIR, max_bytes=CACHE_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None
+
+    def path(self, namespace, key):
+        return self.root / namespace / key[:2] / key
+
+    def get(self, namespace, key):
+        """Return the cached bytes or ``None``, marking the entry as recently used."""
+        path = self.path(namespace, key)
+        try:
+            data = path.read_bytes()
+        except OSError:
+            count('cache_lookups', namespace=namespace, result='miss')
+            return None
+        count('cache_lookups', namespace=namespace, result='hit')
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return data
+
+    def __contains__(self, item):
+        namespace, key = item
+        return self.path(namespace, key).is_file()
+
+    def put(self, namespace, key, data):
+        """Atomically store ``data`` and evict old entries if over budget."""
+        path = self.path(namespace, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            previous = path.stat().st_size
+        except OSError:
+            previous = 0
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=_TMP_PREFIX)
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            try:
+                os.unlink(tmp)
+            except OSError:
+                pass
+            raise
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += len(data) - previous
+            over_budget = self._size > self.max_bytes
+        if over_budget:
+            self.evict()
+        return path
+
+    def _entries(self):
+        if not self.root.is_dir():
+            return
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.startswith(_TMP_PREFIX):
+                    continue
+                path = Path(dirpath) / filename
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                yield stat.st_mtime, stat.st_size, path
+
+    def _scan_size(self):
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self):
+        """Delete least recently used entries until the cache is back under budget."""
+        with self._lock:
+            entries = sorted(self._entries())
+            total = sum(size for _, size, _ in entries)
+            target = self.max_bytes * EVICT_TARGET
+            for _, size, path in entries:
+                if total <= target:
+                    break
+                try:
+                    path.unlink()
+                except OSError:
+                    continue
+                total -= size
+            self._size = total
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def get_cache():
+    """Return the process-wide cache shared by every session."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = DiskCache()
+        return _default_cache
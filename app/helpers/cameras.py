@@ -0,0 +1,86 @@
+"""Maintained normalization table for camera makes and models.
+
+EXIF makes come in many spellings ("NIKON CORPORATION", "OLYMPUS IMAGING
+CORP.", "EASTMAN KODAK COMPANY", ...).  ``MAKES`` maps lowercase prefixes
+to one label per manufacturer; anything unknown is reported as "Other".
+Add new spellings here rather than in the pages.
+"""
+import datetime
+import re
+
+OTHER = 'Other'
+
+# Lowercase prefix of the EXIF make -> label shown in the app
+MAKES = {
+    'apple': 'Apple',
+    'asahi optical': 'Pentax',
+    'benq': 'BenQ',
+    'blackberry': 'BlackBerry',
+    'canon': 'Canon',
+    'casio': 'Casio',
+    'eastman kodak': 'Kodak',
+    'fuji photo film': 'Fujifilm',
+    'fujifilm': 'Fujifilm',
+    'hewlett-packard': 'HP',
+    'hp': 'HP',
+    'htc': 'HTC',
+    'konica': 'Konica',
+    'kodak': 'Kodak',
+    'kyocera': 'Kyocera',
+    'leica': 'Leica',
+    'lg electronics': 'LG',
+    'minolta': 'Minolta',
+    'motorola': 'Motorola',
+    'nikon': 'Nikon',
+    'nokia': 'Nokia',
+    'olympus': 'Olympus',
+    'panasonic': 'Panasonic',
+    'pentax': 'Pentax',
+    'research in motion': 'BlackBerry',
+    'ricoh': 'Ricoh',
+    'samsung': 'Samsung',
+    'sanyo': 'Sanyo',
+    'sharp': 'Sharp',
+    'sony': 'Sony',
+    'sony ericsson': 'Sony Ericsson',
+    'vivitar': 'Vivitar',
+}
+
+# Longest prefix first, so "sony ericsson" style entries win over "sony"
+_PREFIXES = sorted(MAKES, key=len, reverse=True)
+
+_DATETIME = re.compile(r"(\d{4})[:\-/.](\d{1,2})[:\-/.](\d{1,2})[ T]+(\d{1,2}):(\d{2})(?::(\d{2}))?")
+
+
+def _clean(value):
+    if value is None or (isinstance(value, float) and value != value):
+        return ''
+    if isinstance(value, bytes):
+        value = value.decode('latin-1')
+    return ' '.join(str(value).replace('\x00', ' ').split())
+
+
+def normalize_make(value):
+    """Map a raw EXIF make to its label from ``MAKES``, or "Other"."""
+    make = _clean(value).lower()
+    for prefix in _PREFIXES:
+        if make.startswith(prefix) and not make[len(prefix):len(prefix) + 1].isalnum():
+            return MAKES[prefix]
+    return OTHER
+
+
+def clean_text(value):
+    """Strip padding and NUL bytes from a raw EXIF string such as a make or model; ``None`` when empty."""
+    return _clean(value) or None
+
+
+def parse_exif_datetime(value):
+    """Parse EXIF style timestamps ("2010:08:05 10:08:31" and common variants); ``None`` if invalid."""
+    match = _DATETIME.search(_clean(value))
+    if not match:
+        return None
+    year, month, day, hour, minute, second = (int(part or 0) for part in match.groups())
+    try:
+        return datetime.datetime(year, month, day, hour, minute, second)
+    except ValueError:
+        return None
@@ -0,0 +1,200 @@
+"""Process-wide HTTP client for the release host.
+
+Every page, session and helper shares one keep-alive ``requests`` session.
+Its connection pool is sized for the grid workers plus the background
+prefetch.  Connection errors, timeouts and 429/5xx responses are retried
+with exponential backoff, but never past the caller's deadline.
+
+A circuit breaker per host opens after ``FAILURE_THRESHOLD`` consecutive
+failures.  While it is open, requests to that host fail at once with
+``CircuitOpenError``, and the grids show placeholders instead of waiting out
+a timeout per image.  After ``RESET_AFTER`` seconds one trial request decides
+whether the breaker closes again.
+"""
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .metrics import count
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
+    "Referer": "https://abbottabadcompoundmaterial.streamlit.app/",
+}
+
+POOL_SIZE = int(os.environ.get("ABBOTTABAD_HTTP_POOL", "16"))
+RETRIES = int(os.environ.get("ABBOTTABAD_HTTP_RETRIES", "2"))
+BACKOFF = 0.5
+TIMEOUT = 30
+
+# Consecutive failures that open a host's breaker, and seconds before a trial request
+FAILURE_THRESHOLD = int(os.environ.get("ABBOTTABAD_BREAKER_FAILURES", "5"))
+RESET_AFTER = float(os.environ.get("ABBOTTABAD_BREAKER_RESET", "30"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Failures of the host or the connection to it: retried, and counted by the breaker
+TRANSPORT_ERRORS = (requests.ConnectionError, requests.Timeout,
+                    requests.exceptions.ChunkedEncodingError, requests.exceptions.ContentDecodingError)
+
+
+class CircuitOpenError(requests.ConnectionError):
+    """The host's breaker is open; no request was made."""
+
+
+class DeadlineExceeded(requests.Timeout):
+    """The caller's deadline passed before the request could complete."""
+
+
+class CircuitBreaker:
+    """Closed -> open after repeated failures -> half-open trial -> closed again.
+
+    The trial slot belongs to the thread that got it from ``allow()``; only
+    that thread's ``release()`` or ``record_failure()`` gives it back.
+    """
+
+    def __init__(self, failure_threshold=FAILURE_THRESHOLD, reset_after=RESET_AFTER):
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+        self._trial_owner = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def _owns_trial(self):
+        return self._trial_owner == threading.get_ident()
+
+    def allow(self):
+        """Whether a request may go out now; while open, lets one trial through per ``reset_after``."""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self._trial_owner is not None or time.monotonic() - self.opened_at < self.reset_after:
+                return False
+            self._trial_owner = threading.get_ident()
+            return True
+
+    def release(self):
+        """Give back a trial slot this thread took in ``allow()`` but did not use."""
+        with self._lock:
+            if self._owns_trial():
+                self._trial_owner = None
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_owner = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            trial = self._owns_trial()
+            if trial or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            if trial:
+                self._trial_owner = None
+
+
+def make_session(pool_size=POOL_SIZE):
+    """Return a keep-alive session whose connection pool holds ``pool_size`` connections per host."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update(HEADERS)
+    return session
+
+
+class HttpClient:
+    """Shared session with deadline-aware retries and a circuit breaker per host."""
+
+    def __init__(self, pool_size=POOL_SIZE, retries=RETRIES, backoff=BACKOFF,
+                 failure_threshold=FAILURE_THRESHOLD, reset_after=RESET_AFTER):
+        self.session = make_session(pool_size)
+        self.retries = retries
+        self.backoff = backoff
+        self.failure_threshold = failure_threshold
+        self.reset_after = reset_after
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def breaker(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            breaker = self._breakers.get(host)
+            if breaker is None:
+                breaker = self._breakers[host] = CircuitBreaker(self.failure_threshold, self.reset_after)
+            return breaker
+
+    def get(self, url, timeout=TIMEOUT, deadline=None, **kwargs):
+        """``session.get`` with retries; ``deadline`` is a ``time.monotonic()`` value bounding all attempts.
+
+        Returns the response, including the last 429/5xx one once retries are
+        used up, so callers still see the HTTP error from ``raise_for_status``.
+        """
+        breaker = self.breaker(url)
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                count('circuit_open', host=urlsplit(url).netloc)
+                raise CircuitOpenError(f"{urlsplit(url).netloc} is not responding, skipping {url}")
+            request_timeout = timeout
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    breaker.release()
+                    raise DeadlineExceeded(f"deadline passed before fetching {url}")
+                request_timeout = min(timeout, remaining)
+
+            response = error = None
+            try:
+                response = self.session.get(url, timeout=request_timeout, **kwargs)
+            except TRANSPORT_ERRORS as e:
+                error = e
+            except BaseException:
+                # Not the host's fault (e.g. an invalid URL), but the attempt still ends here
+                breaker.release()
+                raise
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                breaker.record_success()
+                return response
+            if isinstance(error, requests.Timeout) and request_timeout < timeout:
+                # Cut short by the caller's deadline, which says nothing about the host
+                breaker.release()
+                raise DeadlineExceeded(f"deadline passed while fetching {url}") from error
+
+            breaker.record_failure()
+            attempt += 1
+            # Full jitter keeps concurrent sessions from retrying in lockstep
+            delay = random.uniform(0, self.backoff * 2 ** (attempt - 1))
+            out_of_time = deadline is not None and time.monotonic() + delay >= deadline
+            if attempt > self.retries or out_of_time or breaker.is_open:
+                if error is not None:
+                    raise error
+                return response
+            if response is not None:
+                response.close()
+            count('http_retries')
+            time.sleep(delay)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the client shared by every session of this process."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+        return _client
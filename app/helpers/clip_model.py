@@ -0,0 +1,68 @@
+"""CPU-only CLIP text and image encoders.
+
+Needs the optional ``torch`` and ``transformers`` packages; they are only
+imported when an encoder is first used, so the pages run without them.
+Every encoder returns L2-normalized float32 vectors, so cosine similarity
+is a plain dot product.
+"""
+import os
+import threading
+from functools import lru_cache
+
+import numpy as np
+
+MODEL_NAME = os.environ.get("ABBOTTABAD_CLIP_MODEL", "openai/clip-vit-base-patch32")
+
+_models = {}
+_lock = threading.Lock()
+
+
+def load_model(name=MODEL_NAME):
+    """Return ``(model, processor)`` for ``name``, loaded once per process on the CPU."""
+    try:
+        import torch  # noqa: F401
+        from transformers import CLIPModel, CLIPProcessor
+    except ImportError as e:
+        raise ImportError("CLIP encoding needs torch and transformers: pip install torch transformers") from e
+    with _lock:
+        if name not in _models:
+            model = CLIPModel.from_pretrained(name).to("cpu").eval()
+            _models[name] = (model, CLIPProcessor.from_pretrained(name))
+        return _models[name]
+
+
+def _normalize(features):
+    features = features.astype(np.float32)
+    return features / np.linalg.norm(features, axis=-1, keepdims=True).clip(min=1e-12)
+
+
+def encode_texts(texts, name=MODEL_NAME):
+    """Embed a list of strings, one row per text."""
+    # load_model first: it raises the friendly ImportError when torch is missing
+    model, processor = load_model(name)
+    import torch
+
+    with torch.no_grad():
+        inputs = processor(text=list(texts), return_tensors="pt", padding=True, truncation=True)
+        features = model.get_text_features(**inputs)
+    return _normalize(features.numpy())
+
+
+@lru_cache(maxsize=256)
+def encode_query(text, name=MODEL_NAME):
+    """Embed one search string; repeated queries across reruns are served from memory."""
+    vector = encode_texts([text], name)[0]
+    vector.setflags(write=False)
+    return vector
+
+
+def encode_images(images, name=MODEL_NAME):
+    """Embed a list of PIL images, one row per image."""
+    # load_model first: it raises the friendly ImportError when torch is missing
+    model, processor = load_model(name)
+    import torch
+
+    with torch.no_grad():
+        inputs = processor(images=list(images), return_tensors="pt")
+        features = model.get_image_features(**inputs)
+    return _normalize(features.numpy())
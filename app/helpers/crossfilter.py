@@ -0,0 +1,167 @@
+"""Cross-filter query engine for the insight pages.
+
+A ``CrossFilter`` keeps its frame sorted by timestamp, so a date range is two
+``searchsorted`` calls that give a contiguous row span.  Each facet column
+(camera make, camera model) gets an index per value with two parts:
+
+* a sorted posting list of row ids, for counting rows inside a date span
+  with two more binary searches, and
+* a packed bitmap (one bit per row), for intersecting selections across facets.
+
+Queries return row ids into the sorted frame: a ``slice`` when only the dates
+are filtered, otherwise an array.  ``take`` turns them into a frame for the
+rows that are shown.  Facet counts follow the usual cross-filter rule: each
+option is counted under every filter except its own facet.  Repeated counts
+are served from a small cache, so a rerun with unchanged filters costs
+nothing.
+"""
+import datetime
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from .data import IMAGE_CSV, VIDEO_CSV, load_image_metadata, load_videos, memoized
+
+_BIT_COUNTS = np.array([bin(value).count('1') for value in range(256)], dtype=np.int64)
+
+# Facet count results kept per filter
+COUNT_CACHE_SIZE = 256
+
+
+def _span_mask(lo, hi):
+    """Packed mask of rows ``lo <= row < hi`` over the bytes ``lo // 8 .. ceil(hi / 8)``."""
+    first, last = lo // 8, (hi + 7) // 8
+    mask = np.full(last - first, 0xFF, dtype=np.uint8)
+    # np.packbits is big-endian: row r is bit 7 - r % 8 of byte r // 8
+    mask[0] &= 0xFF >> (lo % 8)
+    if hi % 8:
+        mask[-1] &= (0xFF << (8 - hi % 8)) & 0xFF
+    return mask
+
+
+class CrossFilter:
+    """Timestamp-sorted rows with posting lists and bitmaps over the facet columns."""
+
+    def __init__(self, df, time_column='timestamp', facets=()):
+        times = df[time_column].to_numpy()
+        order = np.argsort(times, kind='stable')
+        self.frame = df.iloc[order].reset_index(drop=True)
+        self.times = self.frame[time_column].to_numpy()
+        self.facets = tuple(facets)
+        # NaT sorts last and is never inside a date range
+        self.num_dated = int(np.count_nonzero(~np.isnat(self.times)))
+
+        self._postings = {}
+        self._bitmaps = {}
+        for facet in self.facets:
+            codes, values = pd.factorize(self.frame[facet].astype(object), use_na_sentinel=True)
+            order = np.argsort(codes, kind='stable')
+            bounds = np.searchsorted(codes[order], np.arange(len(values) + 1))
+            postings = {value: order[bounds[code]:bounds[code + 1]] for code, value in enumerate(values)}
+            bitmaps = np.zeros((len(values), (len(self.frame) + 7) // 8), dtype=np.uint8)
+            bits = np.zeros(len(self.frame), dtype=bool)
+            for code, value in enumerate(values):
+                bits[:] = False
+                bits[postings[value]] = True
+                bitmaps[code] = np.packbits(bits, bitorder='big')
+            self._postings[facet] = postings
+            self._bitmaps[facet] = (list(values), {value: code for code, value in enumerate(values)}, bitmaps)
+
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def min_date(self):
+        return pd.Timestamp(self.times[0]).date()
+
+    @property
+    def max_date(self):
+        return pd.Timestamp(self.times[self.num_dated - 1]).date()
+
+    def values(self, facet):
+        """Distinct values of ``facet``, in order of first appearance in time."""
+        return self._bitmaps[facet][0]
+
+    def date_span(self, start_date=None, end_date=None):
+        """``(lo, hi)`` rows from ``start_date`` to the end of ``end_date``, both inclusive."""
+        dated = self.times[:self.num_dated]
+        # Search with the array's own unit; mixed units would convert the whole array
+        lo = 0 if start_date is None else int(np.searchsorted(
+            dated, np.datetime64(start_date).astype(dated.dtype), 'left'))
+        hi = self.num_dated if end_date is None else int(np.searchsorted(
+            dated, np.datetime64(end_date + datetime.timedelta(days=1)).astype(dated.dtype), 'left'))
+        return lo, max(lo, hi)
+
+    def _selection_mask(self, lo, hi, selections, skip=None):
+        """Packed mask over the span's bytes of rows matching every selection (except facet ``skip``)."""
+        mask = None
+        for facet, chosen in selections.items():
+            if facet == skip or not chosen:
+                continue
+            _, codes, bitmaps = self._bitmaps[facet]
+            rows = [codes[value] for value in chosen if value in codes]
+            selected = np.bitwise_or.reduce(bitmaps[rows, lo // 8:(hi + 7) // 8], axis=0) if rows else \
+                np.zeros((hi + 7) // 8 - lo // 8, dtype=np.uint8)
+            mask = selected if mask is None else mask & selected
+        if mask is None:
+            return None
+        return mask & _span_mask(lo, hi)
+
+    def query(self, start_date=None, end_date=None, **selections):
+        """Row ids matching the date range and, per facet, any of the selected values.
+
+        Returns a ``slice`` when no facet is selected, otherwise a sorted array.
+        """
+        lo, hi = self.date_span(start_date, end_date)
+        if hi == lo:
+            return slice(lo, lo)
+        mask = self._selection_mask(lo, hi, selections)
+        if mask is None:
+            return slice(lo, hi)
+        return np.flatnonzero(np.unpackbits(mask, bitorder='big')) + (lo // 8) * 8
+
+    def take(self, rows):
+        """The sorted frame's ``rows``; a date-only slice is a view, not a copy."""
+        return self.frame.iloc[rows]
+
+    def facet_counts(self, facet, start_date=None, end_date=None, **selections):
+        """``{value: rows}`` for every value of ``facet`` under all the other filters."""
+        key = (facet, start_date, end_date,
+               tuple(sorted((name, tuple(chosen)) for name, chosen in selections.items() if name != facet)))
+        with self._lock:
+            if key in self._counts:
+                self._counts.move_to_end(key)
+                return self._counts[key]
+
+        lo, hi = self.date_span(start_date, end_date)
+        values, _, bitmaps = self._bitmaps[facet]
+        mask = self._selection_mask(lo, hi, selections, skip=facet) if hi > lo else None
+        if hi == lo:
+            counts = dict.fromkeys(values, 0)
+        elif mask is None:
+            # Only the dates filter: two binary searches per value on its posting list
+            counts = {value: int(np.searchsorted(postings, hi) - np.searchsorted(postings, lo))
+                      for value, postings in self._postings[facet].items()}
+        else:
+            overlap = bitmaps[:, lo // 8:(hi + 7) // 8] & mask
+            counts = dict(zip(values, _BIT_COUNTS[overlap].sum(axis=1).tolist()))
+
+        with self._lock:
+            self._counts[key] = counts
+            if len(self._counts) > COUNT_CACHE_SIZE:
+                self._counts.popitem(last=False)
+        return counts
+
+
+def load_image_filter(csv_path=IMAGE_CSV):
+    """Cross filter over the images with a timestamp, faceted by camera make and model."""
+    return memoized(('image_filter', str(csv_path)), csv_path,
+                    lambda: CrossFilter(load_image_metadata(csv_path), facets=('camera_make', 'camera_model')))
+
+
+def load_video_filter(csv_path=VIDEO_CSV):
+    """Cross filter over the videos with a timestamp."""
+    return memoized(('video_filter', str(csv_path)), csv_path,
+                    lambda: CrossFilter(load_videos(csv_path)))
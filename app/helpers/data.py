@@ -0,0 +1,159 @@
+"""Typed, memoized access to the datasets under ``data/``.
+
+Each CSV is converted once to a Parquet file next to it with proper dtypes
+(float32 scores, categorical camera makes/models, datetime64 timestamps).
+Pages then get a prepared frame that is read from the memory-mapped Parquet
+file once per process and reused until the CSV changes on disk.
+
+The returned frames are shared by every session: treat them as read-only
+and filter into new frames instead of assigning columns in place.
+"""
+import os
+import stat
+import tempfile
+import threading
+from pathlib import Path
+
+import pandas as pd
+
+from .cameras import OTHER, normalize_make
+from .metrics import timed
+
+DATA_DIR = Path(os.environ.get("ABBOTTABAD_DATA_DIR", Path.cwd() / "data"))
+IMAGE_CSV = DATA_DIR / "df.csv"
+VIDEO_CSV = DATA_DIR / "video_data.csv"
+
+# df.csv holds file and EXIF metadata first, then one CLIP score column per category
+SCORE_COLUMNS_START = 15
+
+IMAGE_TIMESTAMP_FORMAT = '%Y:%m:%d %H:%M:%S'
+VIDEO_TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+IMAGE_METADATA_COLUMNS = ['new_file_name', 'original_file_name', 'full_url', 'timestamp', 'camera_make',
+                          'camera_model']
+
+_frames = {}
+_lock = threading.RLock()
+
+
+def score_columns(df):
+    """Return the CLIP category columns of the image frame."""
+    return list(df.columns[SCORE_COLUMNS_START:])
+
+
+def _typed_images(df):
+    df[score_columns(df)] = df[score_columns(df)].astype('float32')
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format=IMAGE_TIMESTAMP_FORMAT, errors='coerce')
+    for column in ('camera_make', 'camera_model'):
+        df[column] = df[column].astype('category')
+    return df
+
+
+def _typed_videos(df):
+    df['timestamp'] = pd.to_datetime(df['timestamp'], format=VIDEO_TIMESTAMP_FORMAT, errors='coerce')
+    return df
+
+
+def _file_mode(path):
+    """Mode for a rewrite of ``path``: its current mode, or what ``open`` would give a new file."""
+    try:
+        return stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def write_atomic(path, write):
+    """Call ``write(file)`` on a temporary binary file next to ``path``, then move it into place.
+
+    Readers see either the old file or the complete new one, never a partial
+    write.  The file keeps its permissions (``mkstemp`` alone would leave it
+    0600, unreadable to a service running as another user).
+    """
+    path = Path(path)
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, 'wb') as file:
+            write(file)
+        os.chmod(tmp, _file_mode(path))
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def write_csv(df, csv_path):
+    """Atomically replace ``csv_path`` with ``df``."""
+    write_atomic(csv_path, lambda file: df.to_csv(file, index=False))
+
+
+def _write_parquet(df, path):
+    write_atomic(path, lambda file: df.to_parquet(file, index=False))
+
+
+def read_typed(csv_path, convert):
+    """Return ``csv_path`` as a typed frame, going through its Parquet copy when possible.
+
+    The Parquet file is rebuilt whenever the CSV is newer.  Without pyarrow,
+    or on a read-only data directory, this falls back to parsing the CSV.
+    """
+    csv_path = Path(csv_path)
+    parquet_path = csv_path.with_suffix('.parquet')
+    try:
+        if parquet_path.stat().st_mtime_ns >= csv_path.stat().st_mtime_ns:
+            with timed('read_parquet', file=csv_path.name):
+                return pd.read_parquet(parquet_path, memory_map=True)
+    except (OSError, ImportError):
+        pass
+    with timed('read_csv', file=csv_path.name):
+        df = convert(pd.read_csv(csv_path))
+    try:
+        _write_parquet(df, parquet_path)
+    except (OSError, ImportError):
+        pass
+    return df
+
+
+def memoized(name, csv_path, build):
+    """Return ``build()``, reusing the result per process until ``csv_path`` changes."""
+    mtime = Path(csv_path).stat().st_mtime_ns
+    with _lock:
+        cached = _frames.get(name)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        df = build()
+        _frames[name] = (mtime, df)
+        return df
+
+
+def load_images(csv_path=IMAGE_CSV):
+    """All rows of ``df.csv`` with typed scores, timestamps and camera columns."""
+    return memoized(('images', str(csv_path)), csv_path,
+                     lambda: read_typed(csv_path, _typed_images))
+
+
+def load_image_metadata(csv_path=IMAGE_CSV):
+    """Images with a valid timestamp, restricted to the metadata columns.
+
+    Camera makes are normalized through ``cameras.MAKES``; anything else
+    becomes "Other".
+    """
+    def build():
+        df = load_images(csv_path)
+        df = df.loc[df['timestamp'].notna(), IMAGE_METADATA_COLUMNS].reset_index(drop=True)
+        # Categorical map: normalizes each distinct make once; missing makes become "Other"
+        makes = df['camera_make'].map(normalize_make).astype(object).fillna(OTHER)
+        df['camera_make'] = makes.astype('category')
+        return df
+
+    return memoized(('image_metadata', str(csv_path)), csv_path, build)
+
+
+def load_videos(csv_path=VIDEO_CSV):
+    """Videos with a valid timestamp."""
+    def build():
+        df = read_typed(csv_path, _typed_videos)
+        return df[df['timestamp'].notna()].reset_index(drop=True)
+
+    return memoized(('videos', str(csv_path)), csv_path, build)
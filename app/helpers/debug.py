@@ -0,0 +1,36 @@
+"""Optional sidebar panel with the stage timings of the page's previous run."""
+import json
+import os
+
+import pandas as pd
+import streamlit as st
+
+from .metrics import REGISTRY, start_trace
+
+DEBUG = os.environ.get("ABBOTTABAD_DEBUG", "") not in ("", "0")
+
+
+def debug_panel():
+    """Trace this run; with ``?debug=1`` in the URL (or ``ABBOTTABAD_DEBUG=1``) show the last run's timings.
+
+    The panel is drawn at the top of the page, before the run it traces has
+    finished, so it shows the previous run of the same session.
+    """
+    previous = st.session_state.get('debug-trace')
+    st.session_state['debug-trace'] = start_trace()
+    if not (DEBUG or st.query_params.get('debug') == '1'):
+        return
+
+    with st.sidebar.expander("Debug: timings of the last run"):
+        if previous is None:
+            st.write("Interact with the page to see the timings of each run.")
+        else:
+            st.write(f"Last run: {previous.elapsed:.3f} s until its last recorded stage")
+            stages = pd.DataFrame(previous.summary(), columns=['stage', 'calls', 'total (s)', 'slowest (s)'])
+            st.dataframe(stages, hide_index=True, width='stretch')
+            if previous.counters:
+                st.dataframe(pd.Series(previous.counters, name='count'), width='stretch')
+        st.download_button("Process metrics (Prometheus)", REGISTRY.to_prometheus(),
+                           file_name='metrics.txt', mime='text/plain')
+        st.download_button("Process metrics (JSON)", json.dumps(REGISTRY.to_json(), indent=2),
+                           file_name='metrics.json', mime='application/json')
@@ -0,0 +1,163 @@
+"""Stored CLIP image embeddings and free-text semantic search over them.
+
+The offline step writes one float16 row per image next to ``df.csv``:
+
+    data/clip_embeddings.npy        (n, d) float16, L2-normalized
+    data/clip_embeddings_keys.npy   (n,) content hash of each row's file
+    data/clip_embeddings.json       model name and shape
+    data/clip_ivf.npz               optional IVF index (centroids + inverted lists)
+
+At query time the matrix is memory-mapped and scored in batches with a
+single matrix product per batch, or through the IVF index when present.
+
+The matrix is built by the scoring pipeline (``python -m app.helpers.scoring
+embed``), which also reuses it to add new category columns.
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+
+from .cache import cache_key
+from .data import DATA_DIR, IMAGE_CSV, load_images, memoized, write_atomic
+
+EMBEDDINGS_PATH = DATA_DIR / 'clip_embeddings.npy'
+KEYS_PATH = DATA_DIR / 'clip_embeddings_keys.npy'
+META_PATH = DATA_DIR / 'clip_embeddings.json'
+IVF_PATH = DATA_DIR / 'clip_ivf.npz'
+
+# Rows scored per matrix product; bounds the float32 working copy of the float16 store
+SEARCH_BATCH = 65536
+
+
+def top_k(scores, k):
+    """Positions of the ``k`` largest ``scores``, best first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    best = np.argpartition(-scores, k - 1)[:k]
+    return best[np.argsort(-scores[best], kind='stable')]
+
+
+def exact_search(embeddings, query, k, batch_size=SEARCH_BATCH):
+    """Cosine top-``k`` of ``query`` against every row, scored ``batch_size`` rows at a time."""
+    query = np.asarray(query, dtype=np.float32)
+    candidates, candidate_scores = [], []
+    for start in range(0, len(embeddings), batch_size):
+        scores = np.asarray(embeddings[start:start + batch_size], dtype=np.float32) @ query
+        best = top_k(scores, k)
+        candidates.append(best + start)
+        candidate_scores.append(scores[best])
+    if not candidates:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+    candidates = np.concatenate(candidates)
+    candidate_scores = np.concatenate(candidate_scores)
+    best = top_k(candidate_scores, k)
+    return candidates[best], candidate_scores[best]
+
+
+class IVFIndex:
+    """Inverted-file index: rows bucketed by their nearest k-means centroid.
+
+    A search only scores the rows in the ``nprobe`` buckets closest to the
+    query, trading a little recall for far fewer dot products.
+    """
+
+    def __init__(self, centroids, offsets, ids):
+        self.centroids = centroids
+        self.offsets = offsets
+        self.ids = ids
+
+    @classmethod
+    def train(cls, embeddings, n_lists, iterations=10, sample_size=50000, seed=0):
+        rng = np.random.default_rng(seed)
+        n = len(embeddings)
+        sample = np.sort(rng.choice(n, size=min(n, sample_size), replace=False))
+        vectors = np.asarray(embeddings[sample], dtype=np.float32)
+        centroids = vectors[rng.choice(len(vectors), size=min(n_lists, len(vectors)), replace=False)]
+        for _ in range(iterations):
+            assignment = np.argmax(vectors @ centroids.T, axis=1)
+            for list_id in range(len(centroids)):
+                members = vectors[assignment == list_id]
+                if len(members):
+                    centroid = members.mean(axis=0)
+                    centroids[list_id] = centroid / max(np.linalg.norm(centroid), 1e-12)
+
+        assignment = np.empty(n, dtype=np.int32)
+        for start in range(0, n, SEARCH_BATCH):
+            block = np.asarray(embeddings[start:start + SEARCH_BATCH], dtype=np.float32)
+            assignment[start:start + SEARCH_BATCH] = np.argmax(block @ centroids.T, axis=1)
+        ids = np.argsort(assignment, kind='stable').astype(np.int64)
+        offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=len(centroids)))])
+        return cls(centroids, offsets, ids)
+
+    def search(self, embeddings, query, k, nprobe=8):
+        query = np.asarray(query, dtype=np.float32)
+        lists = top_k(self.centroids @ query, nprobe)
+        rows = np.sort(np.concatenate([self.ids[self.offsets[i]:self.offsets[i + 1]] for i in lists]))
+        scores = np.asarray(embeddings[rows], dtype=np.float32) @ query
+        best = top_k(scores, k)
+        return rows[best], scores[best]
+
+    def save(self, path):
+        write_atomic(path, lambda file: np.savez(file, centroids=self.centroids,
+                                                 offsets=self.offsets, ids=self.ids))
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            return cls(arrays['centroids'], arrays['offsets'], arrays['ids'])
+
+
+class EmbeddingStore:
+    """Memory-mapped embeddings aligned to the rows of the image frame."""
+
+    def __init__(self, embeddings, keys, model, frame_rows, ivf=None):
+        self.embeddings = embeddings
+        self.keys = keys
+        self.model = model
+        # Row of the image frame for each embedding, -1 when the image is gone
+        self.frame_rows = frame_rows
+        self.ivf = ivf
+
+    def search(self, query, k=50, exact=False, nprobe=8):
+        """Frame rows of the ``k`` images closest to ``query`` and their cosine similarities."""
+        if self.ivf is not None and not exact:
+            rows, scores = self.ivf.search(self.embeddings, query, k, nprobe)
+        else:
+            rows, scores = exact_search(self.embeddings, query, k)
+        frame_rows = self.frame_rows[rows]
+        keep = frame_rows >= 0
+        return frame_rows[keep], scores[keep]
+
+
+def save_embeddings(embeddings, keys, model, data_dir=DATA_DIR):
+    """Atomically write the embedding matrix, its row keys and metadata."""
+    data_dir = Path(data_dir)
+    embeddings = np.asarray(embeddings, dtype=np.float16)
+    write_atomic(data_dir / EMBEDDINGS_PATH.name, lambda file: np.save(file, embeddings))
+    write_atomic(data_dir / KEYS_PATH.name, lambda file: np.save(file, np.asarray(keys, dtype='U64')))
+    meta = {'model': model, 'count': int(embeddings.shape[0]), 'dimensions': int(embeddings.shape[1])}
+    write_atomic(data_dir / META_PATH.name, lambda file: file.write(json.dumps(meta, indent=2).encode()))
+
+
+def load_embedding_store(csv_path=IMAGE_CSV):
+    """The embedding store stored next to ``df.csv``, or ``None`` if the offline step has not run."""
+    data_dir = Path(csv_path).parent
+    if not (data_dir / EMBEDDINGS_PATH.name).is_file():
+        return None
+
+    def build():
+        df = load_images(csv_path)
+        embeddings = np.load(data_dir / EMBEDDINGS_PATH.name, mmap_mode='r')
+        keys = np.load(data_dir / KEYS_PATH.name)
+        meta = json.loads((data_dir / META_PATH.name).read_text())
+        positions = {key: row for row, key in enumerate(df['original_file_name'].map(cache_key))}
+        frame_rows = np.array([positions.get(key, -1) for key in keys], dtype=np.int64)
+        ivf_path = data_dir / IVF_PATH.name
+        ivf = IVFIndex.load(ivf_path) if ivf_path.is_file() else None
+        return EmbeddingStore(embeddings, keys, meta['model'], frame_rows, ivf)
+
+    # Keyed on the frame's mtime too, so the row mapping follows changes to df.csv
+    name = ('embeddings', str(csv_path), Path(csv_path).stat().st_mtime_ns)
+    return memoized(name, data_dir / EMBEDDINGS_PATH.name, build)
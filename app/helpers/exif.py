@@ -0,0 +1,165 @@
+"""Incremental EXIF extraction for the ``timestamp`` and camera columns of ``df.csv``.
+
+Pillow only parses an image's header on ``Image.open``; the EXIF block is
+read from there without decoding any pixels.  Each local image (from the
+mirror or ``--images-dir``) is read on a process pool and one row per file
+is appended to ``data/exif_metadata.csv`` together with the file's size and
+mtime, so later runs only look at new or changed files.
+
+``--apply`` then rewrites the ``timestamp``, ``camera_make`` and
+``camera_model`` columns of ``df.csv`` atomically, with timestamps in one
+canonical format.  Makes keep the camera's own spelling; they are normalized
+through ``cameras.MAKES`` when the pages load them, so adding a spelling
+there takes effect without re-running the extraction.
+
+Run from the repository root::
+
+    python -m app.helpers.exif --workers 4 --apply
+"""
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import pandas as pd
+
+from .cache import cache_key
+from .cameras import clean_text, normalize_make, parse_exif_datetime
+from .data import DATA_DIR, IMAGE_CSV, IMAGE_TIMESTAMP_FORMAT, write_csv
+from .mirror import local_copy
+
+METADATA_CSV = DATA_DIR / 'exif_metadata.csv'
+METADATA_COLUMNS = ['key', 'size', 'mtime_ns', 'timestamp', 'camera_make', 'camera_model', 'raw_make']
+
+# EXIF tags: Make, Model, DateTime in IFD0; DateTimeOriginal, DateTimeDigitized in the Exif IFD
+MAKE, MODEL, DATETIME = 0x010F, 0x0110, 0x0132
+EXIF_IFD, DATETIME_ORIGINAL, DATETIME_DIGITIZED = 0x8769, 0x9003, 0x9004
+
+# Rows appended to the metadata file per write
+FLUSH_EVERY = 500
+
+
+def read_exif(path):
+    """Camera make, model and capture time from the header of one image file."""
+    from PIL import Image
+
+    with Image.open(path) as image:
+        exif = image.getexif()
+        details = exif.get_ifd(EXIF_IFD)
+        captured = None
+        for value in (details.get(DATETIME_ORIGINAL), details.get(DATETIME_DIGITIZED), exif.get(DATETIME)):
+            captured = parse_exif_datetime(value)
+            if captured is not None:
+                break
+    return {
+        'timestamp': captured.strftime(IMAGE_TIMESTAMP_FORMAT) if captured else None,
+        'camera_make': normalize_make(exif.get(MAKE)) if exif.get(MAKE) else None,
+        'camera_model': clean_text(exif.get(MODEL)),
+        'raw_make': clean_text(exif.get(MAKE)),
+    }
+
+
+def _canonical_timestamp(value):
+    parsed = parse_exif_datetime(value)
+    return parsed.strftime(IMAGE_TIMESTAMP_FORMAT) if parsed else None
+
+
+def _extract_one(item):
+    key, path, size, mtime_ns = item
+    row = {'key': key, 'size': size, 'mtime_ns': mtime_ns}
+    try:
+        row.update(read_exif(path))
+    except Exception:
+        # Unreadable or non-image file: remember it so it is not retried until it changes
+        pass
+    return row
+
+
+def _read_metadata(metadata_csv):
+    metadata = pd.read_csv(metadata_csv, dtype={'key': str})
+    return metadata.drop_duplicates('key', keep='last').set_index('key')
+
+
+def _append_metadata(rows, metadata_csv):
+    frame = pd.DataFrame(rows, columns=METADATA_COLUMNS)
+    frame.to_csv(metadata_csv, mode='a', header=not Path(metadata_csv).is_file(), index=False)
+
+
+def local_images(csv_path=IMAGE_CSV, images_dir=None):
+    """``{key: path}`` for every image of ``df.csv`` available locally."""
+    df = pd.read_csv(csv_path, usecols=['original_file_name'])
+    paths = {}
+    for file_name in df['original_file_name']:
+        path = local_copy(file_name)
+        if path is None and images_dir is not None and (Path(images_dir) / file_name).is_file():
+            path = Path(images_dir) / file_name
+        if path is not None:
+            paths[cache_key(file_name)] = path
+    return paths
+
+
+def extract(paths, metadata_csv=METADATA_CSV, workers=None):
+    """Read EXIF for every path that is new or changed since the last run; returns the count."""
+    seen = _read_metadata(metadata_csv) if Path(metadata_csv).is_file() else None
+    todo = []
+    for key, path in paths.items():
+        stat = Path(path).stat()
+        if seen is not None and key in seen.index:
+            previous = seen.loc[key]
+            if previous['size'] == stat.st_size and previous['mtime_ns'] == stat.st_mtime_ns:
+                continue
+        todo.append((key, str(path), stat.st_size, stat.st_mtime_ns))
+    print(f"{len(paths) - len(todo)} images unchanged, {len(todo)} to read")
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for row in pool.map(_extract_one, todo, chunksize=64):
+            rows.append(row)
+            if len(rows) >= FLUSH_EVERY:
+                _append_metadata(rows, metadata_csv)
+                rows = []
+    if rows:
+        _append_metadata(rows, metadata_csv)
+    return len(todo)
+
+
+def apply(csv_path=IMAGE_CSV, metadata_csv=METADATA_CSV):
+    """Rewrite the timestamp and camera columns of ``df.csv``; returns rows that gained a timestamp."""
+    raw = pd.read_csv(csv_path)
+    metadata = _read_metadata(metadata_csv) if Path(metadata_csv).is_file() else None
+    before = pd.to_datetime(raw['timestamp'], format=IMAGE_TIMESTAMP_FORMAT, errors='coerce').notna()
+
+    # Existing values are cleaned the same way as freshly extracted ones; makes stay raw
+    timestamps = raw['timestamp'].map(_canonical_timestamp)
+    makes = raw['camera_make'].map(clean_text, na_action='ignore')
+    models = raw['camera_model'].map(clean_text, na_action='ignore')
+    if metadata is not None:
+        extracted = metadata.reindex(raw['original_file_name'].map(cache_key)).set_axis(raw.index)
+        extracted_timestamps = extracted['timestamp'].map(_canonical_timestamp)
+        timestamps = extracted_timestamps.where(extracted_timestamps.notna(), timestamps)
+        makes = extracted['raw_make'].where(extracted['raw_make'].notna(), makes)
+        models = extracted['camera_model'].where(extracted['camera_model'].notna(), models)
+
+    raw['timestamp'] = timestamps
+    raw['camera_make'] = makes
+    raw['camera_model'] = models
+
+    write_csv(raw, csv_path)
+    return int((raw['timestamp'].notna() & ~before).sum())
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Extract EXIF metadata for the images in df.csv.")
+    parser.add_argument('--images-dir', help="local copy of the release (the mirror is used when present)")
+    parser.add_argument('--workers', type=int, help="parallel readers (default: all CPUs)")
+    parser.add_argument('--apply', action='store_true', help="rewrite the df.csv columns afterwards")
+    args = parser.parse_args(argv)
+
+    read = extract(local_images(IMAGE_CSV, args.images_dir), METADATA_CSV, args.workers)
+    print(f"read EXIF from {read} images into {METADATA_CSV}")
+    if args.apply:
+        recovered = apply()
+        print(f"updated {IMAGE_CSV}; {recovered} more rows now have a timestamp")
+
+
+if __name__ == '__main__':
+    main()
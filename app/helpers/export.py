@@ -0,0 +1,304 @@
+"""Bulk export of a page's filtered rows as ZIP files with a manifest.
+
+``export_rows`` fetches the files of the rows on a bounded thread pool.  Each
+file comes from the local mirror, the disk cache or a streamed download, in
+that order.  A download is first staged in a scratch file, and the main thread
+then copies it into the archive in chunks and deletes it.  Memory therefore
+stays flat whatever the size of the selection; at most ``2 * workers`` staged
+files are on disk at a time.  Files are stored without compression, since
+JPEGs and videos are already compressed.
+
+An archive is split into parts of at most ``PART_BYTES`` (150 MB by default).  The last
+part also holds ``manifest.csv`` and ``manifest.json``, with one entry per
+row: its metadata, where it sits in the archive, and the error if the file
+could not be fetched.  A file larger than a part is left out with an error
+entry, since its part could not be served.
+
+The parts are written under ``app/static/exports`` so that Streamlit's static
+file serving (``server.enableStaticServing``, see ``.streamlit/config.toml``)
+streams them from disk.  Streamlit serves files of up to 200 MB that way.
+Without static serving, ``export_panel`` falls back to ``st.download_button``,
+which reads one part into memory only when its button is clicked.  Exports
+expire after ``EXPORT_TTL`` seconds and are trimmed to ``EXPORT_MAX_BYTES``.
+"""
+import contextvars
+import datetime
+import os
+import re
+import secrets
+import shutil
+import tempfile
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+
+import pandas as pd
+import streamlit as st
+
+from .cache import ORIGINALS, cache_key, get_cache
+from .client import TIMEOUT, get_client
+from .fetch import MAX_WORKERS
+from .metrics import count, observe, timed
+from .mirror import CHUNK_SIZE, local_copy
+
+STATIC_DIR = Path(__file__).resolve().parents[1] / "static"
+EXPORT_DIR = Path(os.environ.get("ABBOTTABAD_EXPORT_DIR", STATIC_DIR / "exports"))
+
+# Streamlit serves static files up to 200 MB and disables static serving above 1 GB in total
+PART_BYTES = int(os.environ.get("ABBOTTABAD_EXPORT_PART_MB", "150")) * 1024 * 1024
+EXPORT_MAX_BYTES = int(os.environ.get("ABBOTTABAD_EXPORT_MAX_MB", "900")) * 1024 * 1024
+EXPORT_TTL = int(os.environ.get("ABBOTTABAD_EXPORT_TTL", "3600"))
+# Rows per export, so one click cannot queue the whole release
+EXPORT_LIMIT = int(os.environ.get("ABBOTTABAD_EXPORT_LIMIT", "20000"))
+
+_TMP_PREFIX = ".tmp-"
+
+
+@dataclass
+class Export:
+    """Archive parts of one export, in order, and how many files made it in."""
+    parts: list = field(default_factory=list)
+    files: int = 0
+    failed: int = 0
+    bytes: int = 0
+
+    @property
+    def ready(self):
+        return bool(self.parts) and all(part.is_file() for part in self.parts)
+
+
+def prune_exports(root=EXPORT_DIR, max_age=EXPORT_TTL, max_bytes=EXPORT_MAX_BYTES):
+    """Delete expired exports, then the oldest ones until the rest fit in ``max_bytes``."""
+    root = Path(root)
+    if not root.is_dir():
+        return
+    now = time.time()
+    entries = []
+    for path in root.iterdir():
+        try:
+            stat = path.stat()
+        except OSError:
+            continue
+        # Unfinished parts of a crashed export expire too
+        if now - stat.st_mtime > max_age:
+            if path.is_dir():
+                shutil.rmtree(path, ignore_errors=True)
+            else:
+                path.unlink(missing_ok=True)
+        elif path.is_file() and not path.name.startswith(_TMP_PREFIX):
+            entries.append((stat.st_mtime, stat.st_size, path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        path.unlink(missing_ok=True)
+        total -= size
+
+
+def _stage(file_name, url, scratch, cache, client, timeout):
+    """``(path, source)`` of a file holding the original ``file_name``, downloading ``url`` into ``scratch`` if needed."""
+    mirrored = local_copy(file_name)
+    if mirrored is not None:
+        return mirrored, 'mirror'
+    key = cache_key(file_name)
+    staged = Path(scratch) / key
+    if (ORIGINALS, key) in cache:
+        try:
+            # A copy, so that eviction cannot remove the file before it is archived
+            shutil.copyfile(cache.path(ORIGINALS, key), staged)
+            return staged, 'cache'
+        except OSError:
+            pass
+    with timed('http_get'):
+        with client.get(url, timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            with open(staged, 'wb') as file:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    file.write(chunk)
+    count('fetched_bytes', staged.stat().st_size)
+    return staged, 'network'
+
+
+def _manifest_frame(rows, entries):
+    manifest = rows.reset_index(drop=True).copy()
+    for column, dtype in (('archive_path', object), ('part', 'Int64'), ('size', 'Int64'),
+                          ('source', object), ('error', object)):
+        manifest[column] = pd.array([entry.get(column) for entry in entries], dtype=dtype)
+    return manifest
+
+
+def export_rows(rows, name, root=EXPORT_DIR, workers=MAX_WORKERS, part_bytes=PART_BYTES,
+                timeout=TIMEOUT, progress=None, client=None):
+    """Write the files of ``rows`` and their manifest to ZIP parts under ``root``.
+
+    ``rows`` needs ``original_file_name`` and ``full_url`` columns; files are
+    stored under their ``original_file_name``.
+    ``progress(done, total)``, if given, is called from the calling thread
+    after each file.  Rows whose file cannot be fetched are only listed in
+    the manifest, with their error, and so are files larger than
+    ``part_bytes``.
+    """
+    root = Path(root)
+    root.mkdir(parents=True, exist_ok=True)
+    prune_exports(root)
+    cache = get_cache()
+    client = client or get_client()
+    slug = re.sub(r"[^A-Za-z0-9]+", "-", name).strip("-").lower() or "export"
+    # Unguessable, since the parts are served to anyone who knows the URL
+    stem = f"{slug}-{datetime.datetime.now():%Y%m%d-%H%M%S}-{secrets.token_hex(8)}"
+
+    rows = rows.reset_index(drop=True)
+    total = len(rows)
+    file_names = rows['original_file_name'].tolist()
+    urls = rows['full_url'].tolist()
+    entries = [{} for _ in range(total)]
+    archived = {}
+    result = Export()
+    part_paths = []
+    archive = None
+    part_size = 0
+
+    def next_part():
+        nonlocal archive, part_size
+        if archive is not None:
+            archive.close()
+        path = root / f"{_TMP_PREFIX}{stem}-part{len(part_paths) + 1}.zip"
+        part_paths.append(path)
+        archive = zipfile.ZipFile(path, 'w', compression=zipfile.ZIP_STORED, allowZip64=True)
+        part_size = 0
+
+    def fetch(position):
+        started = time.perf_counter()
+        source = 'error'
+        try:
+            path, source = _stage(file_names[position], urls[position], scratch, cache, client, timeout)
+            return position, path, source, None
+        except Exception as e:
+            return position, None, source, e
+        finally:
+            observe('export_fetch', time.perf_counter() - started, source=source)
+            count('exported_files', source=source)
+
+    try:
+        with timed('export'), tempfile.TemporaryDirectory(dir=root, prefix=_TMP_PREFIX) as scratch, \
+                ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            next_part()
+            pending = set()
+            next_position = done = 0
+            while next_position < total or pending:
+                # Keep a bounded window in flight, so staged files never pile up on disk
+                while next_position < total and len(pending) < 2 * max(1, workers):
+                    file_name = file_names[next_position]
+                    if file_name in archived:
+                        # Listed in the manifest once the first row with this file is done
+                        next_position += 1
+                        done += 1
+                        continue
+                    archived[file_name] = entries[next_position]
+                    pending.add(pool.submit(contextvars.copy_context().run, fetch, next_position))
+                    next_position += 1
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED) if pending else (set(), pending)
+                for future in finished:
+                    position, path, source, error = future.result()
+                    entry = entries[position]
+                    size = path.stat().st_size if error is None else None
+                    if error is None and size > part_bytes:
+                        # Even alone in a part it would exceed what static serving sends
+                        error = f"larger than the {part_bytes / 1e6:.0f} MB part size"
+                    if error is not None:
+                        if path is not None and path.parent == Path(scratch):
+                            path.unlink()
+                        entry.update(size=size, source=source, error=str(error))
+                        result.failed += 1
+                    else:
+                        if part_size and part_size + size > part_bytes:
+                            next_part()
+                        archive_path = f"files/{file_names[position]}"
+                        archive.write(path, archive_path)
+                        if path.parent == Path(scratch):
+                            path.unlink()
+                        part_size += size
+                        result.files += 1
+                        result.bytes += size
+                        entry.update(archive_path=archive_path, part=len(part_paths), size=size, source=source)
+                    done += 1
+                    if progress is not None:
+                        progress(done, total)
+
+            # Rows for files already archived share that file's entry
+            for position, file_name in enumerate(file_names):
+                if not entries[position]:
+                    entries[position] = dict(archived[file_name])
+            manifest = _manifest_frame(rows, entries)
+            archive.writestr('manifest.csv', manifest.to_csv(index=False))
+            archive.writestr('manifest.json', manifest.to_json(orient='records', date_format='iso', indent=2))
+            archive.close()
+    except BaseException:
+        # e.g. a rerun stopped the page mid-export: drop the unfinished parts
+        if archive is not None:
+            archive.close()
+        for path in part_paths:
+            path.unlink(missing_ok=True)
+        raise
+
+    # Publish the finished parts under their final names; a single part needs no suffix
+    for number, path in enumerate(part_paths, start=1):
+        final = root / (f"{stem}.zip" if len(part_paths) == 1 else f"{stem}-part{number}.zip")
+        os.replace(path, final)
+        result.parts.append(final)
+    return result
+
+
+def _static_url(path):
+    """Relative URL of ``path`` under Streamlit's static serving, or ``None`` if it is not served."""
+    if not st.get_option('server.enableStaticServing'):
+        return None
+    try:
+        return 'app/static/' + Path(path).resolve().relative_to(STATIC_DIR).as_posix()
+    except ValueError:
+        return None
+
+
+def _selection_signature(rows):
+    return len(rows), int(pd.util.hash_pandas_object(rows['original_file_name'], index=False).sum())
+
+
+def export_panel(rows, name, key):
+    """Sidebar expander that exports ``rows`` and their files, and offers the ZIP parts for download."""
+    with st.sidebar.expander("Export as ZIP"):
+        if rows.empty:
+            st.write("Nothing to export.")
+            return
+        if len(rows) > EXPORT_LIMIT:
+            st.warning(f"Only the first {EXPORT_LIMIT} of {len(rows)} rows will be exported.")
+            rows = rows.head(EXPORT_LIMIT)
+        signature = _selection_signature(rows)
+
+        if st.button(f"Build ZIP of {len(rows)} files", key=f"{key}-build-zip"):
+            bar = st.progress(0.0, text="Fetching files ...")
+            export = export_rows(rows, name, progress=lambda done, total: bar.progress(
+                done / total, text=f"{done} of {total} files"))
+            bar.empty()
+            st.session_state[f"{key}-zip"] = (signature, export)
+
+        signature_built, export = st.session_state.get(f"{key}-zip", (None, None))
+        if export is None or signature_built != signature:
+            st.write("Writes the files and a manifest (CSV and JSON) to a ZIP archive.")
+            return
+        if not export.ready:
+            st.write("The last export has expired; build it again.")
+            return
+        failed = f", {export.failed} could not be exported (listed in the manifest)" if export.failed else ""
+        st.write(f"{export.files} files, {export.bytes / 1e6:.0f} MB{failed}.")
+        for number, part in enumerate(export.parts, start=1):
+            label = f"Download {part.name} ({part.stat().st_size / 1e6:.0f} MB)"
+            url = _static_url(part)
+            if url is not None:
+                # Streamed from disk by Streamlit's static file server
+                st.link_button(label, url)
+            else:
+                # Read into memory only when clicked, one part at a time
+                st.download_button(label, data=lambda part=part: part.read_bytes(), file_name=part.name,
+                                   mime='application/zip', key=f"{key}-zip-{number}", on_click='ignore')
@@ -0,0 +1,122 @@
+"""Concurrent image fetching shared by the image pages.
+
+Downloads run on a bounded thread pool over the process-wide HTTP client
+(see ``helpers.client``), so a page waits roughly as long as its slowest
+image instead of the sum of all of them, and no longer than its deadline.
+"""
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Optional
+
+from .cache import ORIGINALS, cache_key, get_cache
+from .client import TIMEOUT, get_client
+from .metrics import count, observe, timed
+from .mirror import local_copy
+
+# Upper bound on simultaneous downloads per page run
+MAX_WORKERS = int(os.environ.get("ABBOTTABAD_FETCH_WORKERS", "8"))
+
+
+@dataclass
+class FetchResult:
+    """Outcome of one download; ``position`` is the row's place in the request."""
+    position: int
+    url: str
+    content: Optional[bytes] = None
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def fetch_bytes(url, timeout=TIMEOUT, deadline=None, client=None):
+    """Download ``url`` and return the body, rejecting non-image responses."""
+    with timed('http_get'):
+        response = (client or get_client()).get(url, timeout=timeout, deadline=deadline)
+        response.raise_for_status()
+        content_type = response.headers.get("Content-Type", "")
+        if content_type and not content_type.startswith("image/"):
+            raise ValueError(f"unexpected content type {content_type!r}")
+        content = response.content
+    count('fetched_bytes', len(content))
+    return content
+
+
+def read_original(row, images_dir=None, client=None):
+    """Return the original bytes for a dataset row: local copy, mirror, disk cache, then network."""
+    mirrored = local_copy(row['original_file_name'])
+    if mirrored is not None:
+        return mirrored.read_bytes()
+    if images_dir is not None:
+        url_path = row['full_url'].split('/abbottabad-compound/', 1)[-1]
+        for path in (Path(images_dir) / row['original_file_name'], Path(images_dir) / url_path):
+            if path.is_file():
+                return path.read_bytes()
+    cache = get_cache()
+    key = cache_key(row['original_file_name'])
+    content = cache.get(ORIGINALS, key)
+    if content is None:
+        content = fetch_bytes(row['full_url'], client=client)
+        cache.put(ORIGINALS, key, content)
+    return content
+
+
+def fetch_all(urls, max_workers=MAX_WORKERS, timeout=TIMEOUT, cache=None, transform=None,
+              deadline=None, client=None):
+    """Download ``urls`` concurrently and yield a ``FetchResult`` per URL as it completes.
+
+    Results arrive in completion order; use ``FetchResult.position`` to place
+    them so the grid keeps the order of the filtered rows.  Files are keyed by
+    the file name that ends each URL, the same key as the row's
+    ``original_file_name``.  Files in the local mirror are read from it.  With
+    a ``cache``, originals already on disk are served from it and new
+    downloads are stored.  ``deadline`` (a ``time.monotonic()`` value) bounds
+    every download including retries.
+    ``transform(url, content)``, if given, runs on the worker thread and its
+    return value replaces the content (e.g. to build a thumbnail).
+    """
+    urls = list(urls)
+    if not urls:
+        return
+    client = client or get_client()
+
+    def _fetch(position, url):
+        started = time.perf_counter()
+        source = 'network'
+        try:
+            mirrored = local_copy(url)
+            if mirrored is not None:
+                source = 'mirror'
+                content = mirrored.read_bytes()
+            elif cache is None:
+                content = fetch_bytes(url, timeout, deadline, client)
+            else:
+                key = cache_key(url)
+                content = cache.get(ORIGINALS, key)
+                if content is None:
+                    content = fetch_bytes(url, timeout, deadline, client)
+                    cache.put(ORIGINALS, key, content)
+                else:
+                    source = 'cache'
+            if transform is not None:
+                content = transform(url, content)
+            return FetchResult(position, url, content=content)
+        except Exception as e:
+            source = 'error'
+            return FetchResult(position, url, error=e)
+        finally:
+            # Per-request latency, including any transform, by where the bytes came from
+            observe('fetch', time.perf_counter() - started, source=source)
+            count('fetches', source=source)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(urls)))) as pool:
+        # Each task runs in a copy of the caller's context, so its timings join the page's trace
+        futures = [pool.submit(contextvars.copy_context().run, _fetch, position, url)
+                   for position, url in enumerate(urls)]
+        for future in as_completed(futures):
+            yield future.result()
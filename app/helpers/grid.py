@@ -0,0 +1,63 @@
+"""Image grid rendering shared by the image pages."""
+import os
+import secrets
+import time
+
+import streamlit as st
+
+from .client import CircuitOpenError, DeadlineExceeded
+from .metrics import timed
+from .thumbnails import fetch_thumbnails, prefetch_thumbnails
+
+PAGE_SIZE = int(os.environ.get("ABBOTTABAD_PAGE_SIZE", "24"))
+# Seconds a grid page may spend downloading before the remaining cells show placeholders
+PAGE_DEADLINE = float(os.environ.get("ABBOTTABAD_PAGE_DEADLINE", "20"))
+
+
+def show_image_grid(rows, caption, key, num_columns=3, page_size=PAGE_SIZE):
+    """Show one page of ``rows`` as an image grid, with a pager and the total match count.
+
+    Only the current page is fetched and decoded; the next page is prefetched
+    in the background.  ``caption(row)`` builds each image caption and ``key``
+    should change with the page's filters so the pager resets to page one.
+    Cells are laid out in row order and filled as thumbnails arrive; each
+    links to the full-resolution original.  Images not loaded within
+    ``PAGE_DEADLINE`` seconds, or while the image host's circuit breaker is
+    open, get a placeholder instead.
+    """
+    total = len(rows)
+    if total == 0:
+        st.write("No matching images. Try widening the filters.")
+        return
+
+    pages = -(-total // page_size)
+    page = 1
+    if pages > 1:
+        page = int(st.number_input(f"Page (1 - {pages})", min_value=1, max_value=pages,
+                                   value=1, step=1, key=f"grid-page-{key}"))
+    start = (page - 1) * page_size
+    page_rows = rows.iloc[start:start + page_size]
+    st.write(f"{total} matching images - showing {start + 1} to {start + len(page_rows)}")
+
+    urls = page_rows['full_url'].tolist()
+    captions = [caption(row) for _, row in page_rows.iterrows()]
+    columns = st.columns(num_columns)
+    cells = [columns[position % num_columns].empty() for position in range(len(urls))]
+
+    for result in fetch_thumbnails(urls, deadline=time.monotonic() + PAGE_DEADLINE):
+        cell = cells[result.position]
+        if isinstance(result.error, (CircuitOpenError, DeadlineExceeded)):
+            cell.info(f"{captions[result.position]} - not loaded, the image server is slow or unavailable. "
+                      f"[Open original]({result.url})")
+            continue
+        if not result.ok:
+            cell.error(f"Error loading image: {result.error}, {result.url}")
+            continue
+        with cell.container(), timed('render'):
+            st.image(result.content, caption=captions[result.position], width='stretch')
+            st.markdown(f"[Open original]({result.url})")
+
+    if page < pages:
+        # One pending prefetch per session: a rerun with other filters replaces the previous one
+        owner = st.session_state.setdefault('prefetch-owner', secrets.token_hex(8))
+        prefetch_thumbnails(rows['full_url'].iloc[start + page_size:start + 2 * page_size], owner=owner)
@@ -0,0 +1,236 @@
+"""Hot-path timers, counters and latency histograms.
+
+The helpers and pages time their expensive stages with ``timed(stage)``:
+CSV/Parquet reads, filters, HTTP requests, image decodes and ``st.image``
+calls.  Counters record fetch sources and cache hits.  Every observation goes to
+the process-wide ``REGISTRY``, which exports Prometheus text or JSON.  When a
+page has called ``start_trace()``, the observation also goes to that run's
+``Trace``, which the sidebar debug panel shows (see ``helpers.debug``).
+
+Set ``ABBOTTABAD_METRICS_PORT`` to serve ``/metrics`` (Prometheus text) and
+``/metrics.json`` from a background thread of the Streamlit process.
+"""
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRICS_PORT = int(os.environ.get("ABBOTTABAD_METRICS_PORT", "0"))
+PREFIX = "abbottabad"
+
+# Upper bounds (seconds) of the histogram buckets, from cache hits to upstream timeouts
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _label_key(labels):
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(label_key, extra=()):
+    pairs = [*label_key, *extra]
+    if not pairs:
+        return ""
+    escaped = (value.replace("\\", "\\\\").replace('"', '\\"') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus layout."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        position = 0
+        while position < len(self.buckets) and value > self.buckets[position]:
+            position += 1
+        self.counts[position] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q):
+        """Estimate of the ``q`` quantile, interpolated inside its bucket."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for position, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = self.buckets[position - 1] if position else 0.0
+                upper = self.buckets[position] if position < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+
+class Registry:
+    """Thread-safe store of stage histograms and counters, keyed by name and labels."""
+
+    def __init__(self):
+        self._histograms = {}
+        self._counters = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds, labels):
+        key = (stage, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, labels, amount=1):
+        with self._lock:
+            self._counters[(name, _label_key(labels))] += amount
+
+    def to_json(self):
+        """Histogram summaries and counters as a JSON-serializable dict."""
+        with self._lock:
+            stages = [{'stage': stage, 'labels': dict(labels), 'count': histogram.count,
+                       'sum': round(histogram.sum, 6), 'p50': histogram.quantile(0.5),
+                       'p95': histogram.quantile(0.95), 'p99': histogram.quantile(0.99),
+                       'buckets': dict(zip([*map(str, histogram.buckets), '+Inf'], histogram.counts))}
+                      for (stage, labels), histogram in sorted(self._histograms.items())]
+            counters = [{'name': name, 'labels': dict(labels), 'value': value}
+                        for (name, labels), value in sorted(self._counters.items())]
+        return {'stages': stages, 'counters': counters}
+
+    def to_prometheus(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            name = f"{PREFIX}_stage_seconds"
+            lines += [f"# HELP {name} Time spent per app stage.", f"# TYPE {name} histogram"]
+            for (stage, labels), histogram in sorted(self._histograms.items()):
+                label_key = (('stage', stage), *labels)
+                cumulative = 0
+                for bound, count in zip([*map(str, histogram.buckets), '+Inf'], histogram.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(label_key, [('le', bound)])} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(label_key)} {histogram.sum:.6f}")
+                lines.append(f"{name}_count{_format_labels(label_key)} {histogram.count}")
+            for counter in sorted({counter for counter, _ in self._counters}):
+                lines.append(f"# TYPE {PREFIX}_{counter}_total counter")
+                for (other, labels), value in sorted(self._counters.items()):
+                    if other == counter:
+                        lines.append(f"{PREFIX}_{counter}_total{_format_labels(labels)} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+class Trace:
+    """Stage timings and counters of one page run, for the debug panel."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.finished = self.started
+        self.stages = defaultdict(list)
+        self.counters = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self.stages[stage].append(seconds)
+            self.finished = time.perf_counter()
+
+    def inc(self, name, labels, amount=1):
+        label_text = ", ".join(f"{key}={value}" for key, value in _label_key(labels))
+        with self._lock:
+            self.counters[f"{name} ({label_text})" if label_text else name] += amount
+
+    @property
+    def elapsed(self):
+        """Seconds from the start of the run to its last recorded stage."""
+        return self.finished - self.started
+
+    def summary(self):
+        """``[(stage, calls, total seconds, slowest seconds)]``, most expensive first."""
+        with self._lock:
+            rows = [(stage, len(times), sum(times), max(times)) for stage, times in self.stages.items()]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+
+_trace = contextvars.ContextVar("abbottabad_trace", default=None)
+
+
+def start_trace():
+    """Begin a new trace for the current page run (and the fetches it submits)."""
+    trace = Trace()
+    _trace.set(trace)
+    return trace
+
+
+def observe(stage, seconds, **labels):
+    REGISTRY.observe(stage, seconds, labels)
+    trace = _trace.get()
+    if trace is not None:
+        trace.add(stage, seconds)
+
+
+def count(name, amount=1, **labels):
+    REGISTRY.inc(name, labels, amount)
+    trace = _trace.get()
+    if trace is not None:
+        trace.inc(name, labels, amount)
+
+
+@contextmanager
+def timed(stage, **labels):
+    """Time the enclosed block as ``stage``."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started, **labels)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split('?', 1)[0]
+        if path == '/metrics':
+            body, content_type = REGISTRY.to_prometheus(), 'text/plain; version=0.0.4'
+        elif path == '/metrics.json':
+            body, content_type = json.dumps(REGISTRY.to_json()), 'application/json'
+        else:
+            self.send_error(404)
+            return
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+_server = None
+_server_lock = threading.Lock()
+
+
+def serve(port=METRICS_PORT, host='0.0.0.0'):
+    """Start the metrics endpoint once per process; returns the server, or ``None`` if the port is taken."""
+    global _server
+    with _server_lock:
+        if _server is None:
+            try:
+                _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            except OSError:
+                return None
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="metrics-endpoint", daemon=True).start()
+        return _server
+
+
+if METRICS_PORT:
+    serve(METRICS_PORT)
@@ -0,0 +1,161 @@
+"""Local mirror of the files referenced by ``df.csv`` and ``video_data.csv``.
+
+Files are stored content-addressed under ``mirror/<hash[:2]>/<hash>``, where
+the hash is the MD5 prefix of ``original_file_name``.  Every download is
+verified against that hash before it is moved into place, and recorded in
+``mirror/manifest.jsonl``.  Interrupted transfers keep their ``.part`` file
+and continue with an HTTP range request on the next run.
+
+When the mirror is present the pages read from it instead of cia.gov.
+
+Run from the repository root::
+
+    python -m app.helpers.mirror --workers 8
+
+``--base-url`` points the sync at another host serving the same layout,
+e.g. a local ``python -m http.server`` for testing.
+"""
+import argparse
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+
+from .cache import cache_key
+from .client import get_client
+from .data import IMAGE_CSV, VIDEO_CSV
+
+MIRROR_DIR = Path(os.environ.get("ABBOTTABAD_MIRROR_DIR", Path.cwd() / "mirror"))
+MANIFEST_NAME = "manifest.jsonl"
+RELEASE_URL = "https://www.cia.gov/library/abbottabad-compound/"
+
+CHUNK_SIZE = 1024 * 1024
+TIMEOUT = 60
+
+
+def mirror_path(key, root=MIRROR_DIR):
+    return Path(root) / key[:2] / key
+
+
+def local_copy(url_or_name, root=MIRROR_DIR):
+    """Path of the mirrored file for a release URL or file name, or ``None``."""
+    path = mirror_path(cache_key(url_or_name), root)
+    return path if path.is_file() else None
+
+
+def file_md5(path):
+    digest = hashlib.md5()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest().upper()
+
+
+class Manifest:
+    """Append-only JSON-lines record of verified files, keyed by content hash."""
+
+    def __init__(self, root=MIRROR_DIR):
+        self.path = Path(root) / MANIFEST_NAME
+        self.entries = {}
+        self._lock = threading.Lock()
+        if self.path.is_file():
+            with open(self.path, encoding='utf-8') as file:
+                for line in file:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.entries[entry['key']] = entry
+
+    def add(self, entry):
+        with self._lock:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(entry) + '\n')
+            self.entries[entry['key']] = entry
+
+
+def download(url, key, root=MIRROR_DIR, timeout=TIMEOUT, client=None):
+    """Download ``url`` into the mirror, resuming a partial transfer, and verify it."""
+    final = mirror_path(key, root)
+    part = final.with_name(final.name + '.part')
+    final.parent.mkdir(parents=True, exist_ok=True)
+
+    offset = part.stat().st_size if part.exists() else 0
+    headers = {'Range': f'bytes={offset}-'} if offset else {}
+    with (client or get_client()).get(url, timeout=timeout, headers=headers, stream=True) as response:
+        # 416: the partial file already holds the whole body
+        if not (offset and response.status_code == 416):
+            response.raise_for_status()
+            mode = 'ab' if offset and response.status_code == 206 else 'wb'
+            with open(part, mode) as file:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    file.write(chunk)
+
+    digest = file_md5(part)
+    # Only names carrying the release's MD5 prefix can be verified
+    if len(key) == 32 and digest != key:
+        part.unlink()
+        raise ValueError(f"checksum mismatch: expected {key}, got {digest}")
+    os.replace(part, final)
+    return {'key': key, 'url': url, 'size': final.stat().st_size, 'md5': digest}
+
+
+def release_records(csv_paths=(IMAGE_CSV, VIDEO_CSV)):
+    """``(key, file name, url)`` for every distinct file referenced by the datasets."""
+    records = {}
+    for csv_path in csv_paths:
+        if not Path(csv_path).is_file():
+            continue
+        df = pd.read_csv(csv_path, usecols=['original_file_name', 'full_url'])
+        for file_name, url in zip(df['original_file_name'], df['full_url']):
+            records.setdefault(cache_key(file_name), (file_name, url))
+    return [(key, file_name, url) for key, (file_name, url) in records.items()]
+
+
+def sync(records, root=MIRROR_DIR, workers=8, base_url=None):
+    """Mirror every record not yet in the manifest; returns ``(downloaded, failed)`` counts."""
+    manifest = Manifest(root)
+    todo = [(key, file_name, url) for key, file_name, url in records
+            if not (key in manifest.entries and mirror_path(key, root).is_file())]
+    print(f"{len(records) - len(todo)} files already mirrored, {len(todo)} to download")
+
+    downloaded = failed = 0
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for key, file_name, url in todo:
+            if base_url and url.startswith(RELEASE_URL):
+                url = base_url.rstrip('/') + '/' + url[len(RELEASE_URL):]
+            futures[pool.submit(download, url, key, root)] = file_name
+        for future in as_completed(futures):
+            try:
+                entry = future.result()
+            except Exception as e:
+                failed += 1
+                print(f"failed {futures[future]}: {e}")
+                continue
+            entry['file_name'] = futures[future]
+            manifest.add(entry)
+            downloaded += 1
+            if downloaded % 100 == 0:
+                print(f"downloaded {downloaded}/{len(todo)} files")
+    return downloaded, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Mirror the files referenced by the datasets.")
+    parser.add_argument('--dest', default=str(MIRROR_DIR), help="mirror directory (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=8, help="parallel downloads")
+    parser.add_argument('--base-url', help=f"serve from this host instead of {RELEASE_URL}")
+    args = parser.parse_args(argv)
+
+    downloaded, failed = sync(release_records(), args.dest, args.workers, args.base_url)
+    print(f"downloaded {downloaded} files, {failed} failed")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
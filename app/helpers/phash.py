@@ -0,0 +1,265 @@
+"""Perceptual hashes and near-duplicate clusters for the image grids.
+
+Every image gets a 64-bit pHash (low frequencies of a 32x32 DCT) and dHash
+(horizontal gradients of a 9x8 thumbnail), stored as packed ``uint64``
+arrays in ``data/phash.npz`` together with a cluster id per image.  Two
+images are near-duplicates when their pHashes differ in at most
+``MAX_DISTANCE`` bits.
+
+Lookups use a multi-index Hamming search: the 64 bits are cut into
+``BANDS`` bands of 16 bits, so by the pigeonhole principle any match lies
+within ``MAX_DISTANCE // BANDS`` bits of the query in at least one band.
+Each band is a sorted array; a lookup binary-searches every band value that
+close to the query's, then runs a vectorized popcount over the candidates.
+Wide bands keep the buckets small (about three images per value at 200k
+images), so a lookup touches a few hundred candidates.
+
+The pages look up the cluster of every row of a frame once per frame
+(``load_frame_duplicates``), not on every rerun.
+
+Run from the repository root::
+
+    python -m app.helpers.phash --workers 4
+"""
+import argparse
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from .cache import cache_key
+from .data import DATA_DIR, IMAGE_CSV, memoized, write_atomic
+from .fetch import read_original
+
+PHASH_PATH = DATA_DIR / 'phash.npz'
+MAX_DISTANCE = 6
+BANDS = 4
+
+_BIT_COUNTS = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+
+def popcount(values):
+    """Number of set bits of each ``uint64``."""
+    values = np.ascontiguousarray(values, dtype=np.uint64)
+    return _BIT_COUNTS[values.view(np.uint8)].reshape(*values.shape, 8).sum(axis=-1)
+
+
+def _flips(width, radius):
+    """XOR masks with at most ``radius`` of the low ``width`` bits set."""
+    masks = [sum(1 << bit for bit in bits)
+             for count in range(radius + 1) for bits in itertools.combinations(range(width), count)]
+    return np.array(masks, dtype=np.uint64)
+
+
+def _pack(bits):
+    return np.uint64(int(''.join('1' if bit else '0' for bit in bits.ravel()), 2))
+
+
+def _dct_matrix(size):
+    k = np.arange(size)
+    matrix = np.cos(np.pi * (2 * k[None, :] + 1) * k[:, None] / (2 * size))
+    matrix[0] /= np.sqrt(2)
+    return matrix
+
+
+_DCT_32 = _dct_matrix(32)
+
+
+def image_hashes(content):
+    """``(phash, dhash)`` of an encoded image."""
+    from PIL import Image
+
+    image = Image.open(BytesIO(content))
+    image.draft('L', (64, 64))
+    gray = image.convert('L')
+    pixels = np.asarray(gray.resize((32, 32), Image.LANCZOS), dtype=np.float64)
+    low = (_DCT_32 @ pixels @ _DCT_32.T)[:8, :8]
+    phash = _pack(low > np.median(low.ravel()[1:]))
+    small = np.asarray(gray.resize((9, 8), Image.LANCZOS), dtype=np.int16)
+    dhash = _pack(small[:, 1:] > small[:, :-1])
+    return phash, dhash
+
+
+class DuplicateIndex:
+    """Hashes of every image plus a multi-index over the pHash bands."""
+
+    def __init__(self, keys, phashes, dhashes, clusters=None, max_distance=MAX_DISTANCE):
+        self.keys = np.asarray(keys)
+        self.phashes = np.asarray(phashes, dtype=np.uint64)
+        self.dhashes = np.asarray(dhashes, dtype=np.uint64)
+        self.max_distance = max_distance
+        self.positions = {key: position for position, key in enumerate(self.keys.tolist())}
+
+        width = 64 // BANDS
+        self._mask = np.uint64((1 << width) - 1)
+        self._flips = _flips(width, max_distance // BANDS)
+        self._bands = []
+        for shift in range(0, 64, width):
+            values = (self.phashes >> np.uint64(shift)) & self._mask
+            order = np.argsort(values, kind='stable')
+            self._bands.append((np.uint64(shift), order, values[order]))
+        self.clusters = clusters if clusters is not None else self._cluster()
+
+    def _candidates(self, phash):
+        found = [np.empty(0, dtype=np.intp)]
+        for shift, order, values in self._bands:
+            probes = ((np.uint64(phash) >> shift) & self._mask) ^ self._flips
+            starts = np.searchsorted(values, probes, 'left')
+            ends = np.searchsorted(values, probes, 'right')
+            found += [order[start:end] for start, end in zip(starts.tolist(), ends.tolist()) if end > start]
+        return np.unique(np.concatenate(found))
+
+    def neighbours(self, phash, max_distance=None):
+        """Positions of the images within ``max_distance`` bits of ``phash``, closest first."""
+        max_distance = self.max_distance if max_distance is None else min(max_distance, self.max_distance)
+        candidates = self._candidates(phash)
+        distances = popcount(self.phashes[candidates] ^ np.uint64(phash))
+        keep = distances <= max_distance
+        order = np.argsort(distances[keep], kind='stable')
+        return candidates[keep][order], distances[keep][order]
+
+    def similar(self, url_or_name, max_distance=None):
+        """Keys of the images that look like ``url_or_name`` (itself included), closest first."""
+        position = self.positions.get(cache_key(url_or_name))
+        if position is None:
+            return []
+        positions, _ = self.neighbours(self.phashes[position], max_distance)
+        return self.keys[positions].tolist()
+
+    def _cluster(self):
+        # Union-find over every near-duplicate pair; the smallest position names the cluster
+        parent = np.arange(len(self.keys))
+
+        def find(position):
+            while parent[position] != position:
+                parent[position] = parent[parent[position]]
+                position = parent[position]
+            return position
+
+        for position, phash in enumerate(self.phashes):
+            for other in self.neighbours(phash)[0]:
+                a, b = find(position), find(other)
+                if a != b:
+                    parent[max(a, b)] = min(a, b)
+        return np.array([find(position) for position in range(len(self.keys))], dtype=np.int64)
+
+    def cluster_ids(self, keys):
+        """Cluster id per cache key; keys without a hash get a unique negative id."""
+        positions = pd.Index(self.keys).get_indexer(pd.Index(keys))
+        missing = positions < 0
+        ids = self.clusters[positions]
+        ids[missing] = -1 - np.flatnonzero(missing)
+        return ids
+
+    def save(self, path=PHASH_PATH):
+        write_atomic(path, lambda file: np.savez(file, keys=self.keys, phashes=self.phashes, dhashes=self.dhashes,
+                                                 clusters=self.clusters, max_distance=self.max_distance))
+
+    @classmethod
+    def load(cls, path=PHASH_PATH):
+        with np.load(path) as arrays:
+            return cls(arrays['keys'], arrays['phashes'], arrays['dhashes'], arrays['clusters'],
+                       int(arrays['max_distance']))
+
+
+class FrameDuplicates:
+    """Cluster id and cache key of every row of one frame, for lookups by row position."""
+
+    def __init__(self, frame, index):
+        keys = frame['original_file_name'].map(cache_key)
+        self.index = index
+        self.clusters = index.cluster_ids(keys)
+        self._keys = pd.Index(keys.to_numpy())
+        # Builds the key lookup table now rather than on the first query
+        self._keys.get_indexer_for(self._keys[:1])
+
+    def similar_rows(self, url_or_name, max_distance=None):
+        """Positions of the rows that look like ``url_or_name`` (itself included), closest first."""
+        rows = self._keys.get_indexer_for(self.index.similar(url_or_name, max_distance))
+        return rows[rows >= 0]
+
+
+def collapse_duplicates(rows, duplicates):
+    """Keep the first row of each near-duplicate cluster, in the current order.
+
+    ``rows`` are taken from the frame of ``duplicates`` and keep its default
+    index, so their labels are row positions.  Adds a ``duplicates`` column
+    with the number of hidden copies.
+    """
+    clusters = pd.Series(duplicates.clusters[rows.index.to_numpy()], index=rows.index)
+    first = ~clusters.duplicated()
+    return rows[first.to_numpy()].assign(duplicates=clusters.map(clusters.value_counts())[first] - 1)
+
+
+def with_duplicate_count(caption):
+    """Wrap a grid caption to mention the copies hidden by ``collapse_duplicates``."""
+    def duplicate_caption(row):
+        hidden = row.get('duplicates', 0)
+        return f"{caption(row)} (+{hidden} similar)" if hidden else caption(row)
+    return duplicate_caption
+
+
+def load_duplicate_index(path=PHASH_PATH):
+    """The near-duplicate index, or ``None`` before the offline step has run."""
+    if not Path(path).is_file():
+        return None
+    return memoized(('phash', str(path)), path, lambda: DuplicateIndex.load(path))
+
+
+def load_frame_duplicates(name, frame, csv_path=IMAGE_CSV, path=PHASH_PATH):
+    """``FrameDuplicates`` of the memoized ``frame`` loaded from ``csv_path``, or ``None`` without an index."""
+    index = load_duplicate_index(path)
+    if index is None:
+        return None
+    # Keyed on the frame's mtime too, so the rows follow changes to the CSV
+    key = ('phash_frame', name, str(csv_path), Path(csv_path).stat().st_mtime_ns)
+    return memoized(key, path, lambda: FrameDuplicates(frame, index))
+
+
+def _hash_row(row):
+    try:
+        return (cache_key(row['original_file_name']), *image_hashes(read_original(row)))
+    except Exception as e:
+        print(f"skipping {row['original_file_name']}: {e}")
+        return None
+
+
+def build(csv_path=IMAGE_CSV, path=PHASH_PATH, workers=None, max_distance=MAX_DISTANCE):
+    """Hash every image of ``df.csv``, reusing stored hashes, and rebuild the clusters."""
+    df = pd.read_csv(csv_path, usecols=['original_file_name', 'full_url']).drop_duplicates('original_file_name')
+    known = {}
+    if Path(path).is_file():
+        stored = DuplicateIndex.load(path)
+        known = {key: (phash, dhash) for key, phash, dhash
+                 in zip(stored.keys.tolist(), stored.phashes, stored.dhashes)}
+    todo = [row for row in df.to_dict('records') if cache_key(row['original_file_name']) not in known]
+    print(f"{len(known)} images already hashed, {len(todo)} to go")
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for result in pool.map(_hash_row, todo, chunksize=32):
+            if result is not None:
+                key, phash, dhash = result
+                known[key] = (phash, dhash)
+
+    keys = list(known)
+    index = DuplicateIndex(np.array(keys, dtype='U64'), [known[key][0] for key in keys],
+                           [known[key][1] for key in keys], max_distance=max_distance)
+    index.save(path)
+    return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Hash every image and cluster near-duplicates.")
+    parser.add_argument('--workers', type=int, help="parallel hashing processes (default: all CPUs)")
+    parser.add_argument('--max-distance', type=int, default=MAX_DISTANCE,
+                        help="largest pHash Hamming distance treated as a duplicate")
+    args = parser.parse_args(argv)
+    index = build(workers=args.workers, max_distance=args.max_distance)
+    print(f"{len(index.keys)} images in {len(np.unique(index.clusters))} clusters")
+
+
+if __name__ == '__main__':
+    main()
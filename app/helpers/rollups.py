@@ -0,0 +1,110 @@
+"""Pre-aggregated date histograms for the insight pages.
+
+Counts are bucketed once per (camera make, camera model) group and day and
+kept as cumulative sums along the day axis.  The count for any date range,
+group selection and granularity is then a difference of two prefix sums per
+bin, so plotting cost depends on the number of bins shown, not on the
+number of rows.  Week and month bins are cut from the same daily prefix
+sums, so partial periods at the edges of a range are counted exactly.
+"""
+import datetime
+
+import numpy as np
+import pandas as pd
+
+from .data import IMAGE_CSV, VIDEO_CSV, load_image_metadata, load_videos, memoized
+
+DAY = 'day'
+WEEK = 'week'
+MONTH = 'month'
+
+# Largest span in days shown at daily / weekly resolution before switching to coarser bins
+MAX_DAILY_SPAN = 92
+MAX_WEEKLY_SPAN = 731
+
+
+def choose_granularity(start_date, end_date):
+    """Pick day, week or month bins so the plot stays readable for the selected span."""
+    span = (end_date - start_date).days + 1
+    if span <= MAX_DAILY_SPAN:
+        return DAY
+    if span <= MAX_WEEKLY_SPAN:
+        return WEEK
+    return MONTH
+
+
+class DateRollup:
+    """Daily prefix sums of row counts per (make, model) group."""
+
+    def __init__(self, timestamps, makes=None, models=None):
+        days = timestamps.to_numpy().astype('datetime64[D]')
+        self.origin = days.min()
+        day_index = (days - self.origin).astype(np.int64)
+        self.num_days = int(day_index.max()) + 1
+
+        makes = pd.Series(makes if makes is not None else [''] * len(days)).astype('string').fillna('')
+        models = pd.Series(models if models is not None else [''] * len(days)).astype('string').fillna('')
+        groups = pd.MultiIndex.from_arrays([makes.to_numpy(), models.to_numpy()])
+        group_codes, self.groups = pd.factorize(groups)
+        self.group_makes = np.array([make for make, _ in self.groups], dtype=object)
+        self.group_models = np.array([model for _, model in self.groups], dtype=object)
+
+        counts = np.bincount(group_codes * self.num_days + day_index,
+                             minlength=len(self.groups) * self.num_days)
+        counts = counts.reshape(len(self.groups), self.num_days)
+        self.cumulative = np.zeros((len(self.groups), self.num_days + 1), dtype=np.int64)
+        np.cumsum(counts, axis=1, out=self.cumulative[:, 1:])
+        self.cumulative_total = self.cumulative.sum(axis=0)
+
+        all_days = self.origin + np.arange(self.num_days)
+        weekdays = (all_days.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+        self.period_starts = {
+            DAY: np.arange(self.num_days),
+            WEEK: np.flatnonzero(weekdays == 0),
+            MONTH: np.flatnonzero(all_days == all_days.astype('datetime64[M]').astype('datetime64[D]')),
+        }
+
+    def _day(self, date):
+        index = int((np.datetime64(date, 'D') - self.origin).astype(np.int64))
+        return min(max(index, 0), self.num_days)
+
+    def _selected(self, makes, models):
+        if not makes and not models:
+            return self.cumulative_total
+        mask = np.ones(len(self.groups), dtype=bool)
+        if makes:
+            mask &= np.isin(self.group_makes, [str(make) for make in makes])
+        if models:
+            mask &= np.isin(self.group_models, [str(model) for model in models])
+        return self.cumulative[mask].sum(axis=0)
+
+    def counts(self, start_date, end_date, makes=None, models=None, granularity=None):
+        """Return ``(bin_dates, counts, granularity)`` for ``start_date``..``end_date`` inclusive.
+
+        ``makes``/``models`` restrict the counts to those cameras; empty means all.
+        """
+        granularity = granularity or choose_granularity(start_date, end_date)
+        low = self._day(start_date)
+        high = self._day(end_date + datetime.timedelta(days=1))
+        if high <= low:
+            return np.array([], dtype='datetime64[D]'), np.array([], dtype=np.int64), granularity
+        starts = self.period_starts[granularity]
+        inner = starts[np.searchsorted(starts, low, side='right'):np.searchsorted(starts, high, side='left')]
+        edges = np.concatenate([[low], inner, [high]])
+        cumulative = self._selected(makes, models)
+        return self.origin + edges[:-1], np.diff(cumulative[edges]), granularity
+
+
+def load_image_rollup(csv_path=IMAGE_CSV):
+    """Date rollup of the timestamped images, grouped by camera make and model."""
+    def build():
+        df = load_image_metadata(csv_path)
+        return DateRollup(df['timestamp'], df['camera_make'], df['camera_model'])
+
+    return memoized(('image_rollup', str(csv_path)), csv_path, build)
+
+
+def load_video_rollup(csv_path=VIDEO_CSV):
+    """Date rollup of the timestamped videos."""
+    return memoized(('video_rollup', str(csv_path)), csv_path,
+                    lambda: DateRollup(load_videos(csv_path)['timestamp']))
@@ -0,0 +1,98 @@
+"""Precomputed per-category score index for the classification page.
+
+For every CLIP category the row ids are kept sorted by score, descending,
+as compact NumPy arrays.  A threshold query is then a binary search plus a
+slice and comes back ranked by score, top-K is a plain slice, and AND/OR
+combinations only touch the rows that pass each single condition.
+"""
+import numpy as np
+
+from .data import IMAGE_CSV, load_images, memoized, score_columns
+
+AND = 'and'
+OR = 'or'
+
+
+class ScoreIndex:
+    """Row ids of an image frame sorted by score for each category column."""
+
+    def __init__(self, df, columns):
+        self.size = len(df)
+        self.columns = list(columns)
+        self._order = {}
+        self._negated = {}
+        self._rank = {}
+        self._scores = {}
+        row_dtype = np.int32 if self.size < 2 ** 31 else np.int64
+        for column in self.columns:
+            scores = df[column].to_numpy(dtype=np.float32, na_value=np.nan)
+            # NaN scores sort last and never pass a threshold
+            order = np.argsort(-scores, kind='stable').astype(row_dtype)
+            order = order[~np.isnan(scores[order])]
+            rank = np.full(self.size, self.size, dtype=row_dtype)
+            rank[order] = np.arange(len(order), dtype=row_dtype)
+            self._order[column] = order
+            # Ascending copy of the sorted scores for searchsorted
+            self._negated[column] = -scores[order]
+            self._rank[column] = rank
+            self._scores[column] = scores
+
+    def count(self, column, threshold):
+        """Number of rows with ``column >= threshold``."""
+        return int(np.searchsorted(self._negated[column], -np.float32(threshold), side='right'))
+
+    def above(self, column, threshold, limit=None):
+        """Row ids with ``column >= threshold``, best score first, at most ``limit``."""
+        count = self.count(column, threshold)
+        if limit is not None:
+            count = min(count, limit)
+        return self._order[column][:count]
+
+    def top_k(self, column, k):
+        """The ``k`` best scoring row ids for ``column``."""
+        return self._order[column][:k]
+
+    def scores(self, column, rows):
+        """Scores of ``column`` for the given row ids."""
+        return self._scores[column][rows]
+
+    def query(self, conditions, mode=AND, limit=None):
+        """Row ids matching all (``AND``) or any (``OR``) of ``(column, threshold)`` conditions.
+
+        Results are ranked by the weakest matching score for ``AND`` and the
+        strongest for ``OR``.
+        """
+        conditions = list(conditions)
+        if not conditions:
+            return np.empty(0, dtype=np.int64)
+        if len(conditions) == 1:
+            column, threshold = conditions[0]
+            return self.above(column, threshold, limit)
+
+        counts = [self.count(column, threshold) for column, threshold in conditions]
+        if mode == AND:
+            # Start from the smallest candidate set, check the others by rank
+            smallest = int(np.argmin(counts))
+            rows = self._order[conditions[smallest][0]][:counts[smallest]]
+            for (column, _), count in zip(conditions, counts):
+                rows = rows[self._rank[column][rows] < count]
+            combined = np.min([self._scores[column][rows] for column, _ in conditions], axis=0)
+        elif mode == OR:
+            rows = np.unique(np.concatenate(
+                [self._order[column][:count] for (column, _), count in zip(conditions, counts)]))
+            combined = np.max([np.where(self._rank[column][rows] < count, self._scores[column][rows], -np.inf)
+                               for (column, _), count in zip(conditions, counts)], axis=0)
+        else:
+            raise ValueError(f"unknown query mode {mode!r}")
+
+        rows = rows[np.argsort(-combined, kind='stable')]
+        return rows if limit is None else rows[:limit]
+
+
+def load_score_index(csv_path=IMAGE_CSV):
+    """The score index for ``df.csv``, built once per process alongside the frame."""
+    def build():
+        df = load_images(csv_path)
+        return ScoreIndex(df, score_columns(df))
+
+    return memoized(('score_index', str(csv_path)), csv_path, build)
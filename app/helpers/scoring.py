@@ -0,0 +1,232 @@
+"""Batch CLIP scoring pipeline for ``data/df.csv`` (CPU only).
+
+Two steps, both run from the repository root::
+
+    python -m app.helpers.scoring embed --images-dir /path/to/mirror --workers 4
+    python -m app.helpers.scoring score eye mask "burning car"
+
+``embed`` streams the images from a local copy of the release (falling back
+to the disk cache and the network), decodes and encodes them in batches on
+a process pool, and stores every image embedding in the float16 matrix used
+by free-text search.  Each finished batch is written as a shard first, so an
+interrupted run picks up where it stopped; only images without an embedding
+are encoded.
+
+``score`` then adds category columns from the cached embeddings alone: one
+text encode plus a matrix product, so new keywords take seconds.  A score is
+the probability CLIP assigns to ``PROMPT`` for the category over the neutral
+``BASELINE_PROMPT``, which keeps each column independent of the others.  The
+new columns are appended to ``df.csv`` atomically.
+"""
+import argparse
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from .cache import cache_key
+from .data import DATA_DIR, IMAGE_CSV, load_images, write_csv
+from .embeddings import (EMBEDDINGS_PATH, IVF_PATH, KEYS_PATH, IVFIndex, SEARCH_BATCH,
+                         load_embedding_store, save_embeddings)
+from .fetch import read_original
+
+SHARDS_DIR = DATA_DIR / 'clip_embeddings_parts'
+
+PROMPT = "a photo of a {}"
+BASELINE_PROMPT = "a photo"
+# CLIP's learned temperature for turning cosine similarities into logits
+LOGIT_SCALE = 100.0
+
+# CLIP's input resolution; JPEG draft decoding never goes below it
+INPUT_SIZE = 224
+
+_worker_model = None
+
+
+def _init_worker(model, threads):
+    global _worker_model
+    import torch
+
+    from .clip_model import load_model
+
+    torch.set_num_threads(threads)
+    _worker_model = model
+    load_model(model)
+
+
+def _embed_batch(batch, images_dir):
+    """Worker: decode and encode one batch; returns (keys, float16 vectors, failures)."""
+    from PIL import Image
+
+    from .clip_model import encode_images
+
+    keys, images, failures = [], [], []
+    for key, row in batch:
+        try:
+            image = Image.open(BytesIO(read_original(row, images_dir)))
+            image.draft('RGB', (INPUT_SIZE, INPUT_SIZE))
+            images.append(image.convert('RGB'))
+            keys.append(key)
+        except Exception as e:
+            failures.append((row['original_file_name'], str(e)))
+    if not images:
+        return keys, None, failures
+    return keys, encode_images(images, _worker_model).astype(np.float16), failures
+
+
+def _write_shard(keys, vectors, shards_dir):
+    shards_dir.mkdir(parents=True, exist_ok=True)
+    path = shards_dir / f"part-{keys[0]}.npz"
+    fd, tmp = tempfile.mkstemp(dir=shards_dir, prefix=".part-", suffix=".tmp")
+    with os.fdopen(fd, 'wb') as file:
+        np.savez(file, keys=np.asarray(keys, dtype='U64'), vectors=vectors)
+    os.replace(tmp, path)
+
+
+def _stored_embeddings(data_dir, shards_dir):
+    """Yield ``(keys, vectors)`` blocks from the consolidated matrix and any shards."""
+    if (data_dir / EMBEDDINGS_PATH.name).is_file():
+        yield np.load(data_dir / KEYS_PATH.name), np.load(data_dir / EMBEDDINGS_PATH.name, mmap_mode='r')
+    if shards_dir.is_dir():
+        for path in sorted(shards_dir.glob('part-*.npz')):
+            with np.load(path) as shard:
+                yield shard['keys'], shard['vectors']
+
+
+def consolidate(model, data_dir=DATA_DIR, shards_dir=SHARDS_DIR):
+    """Merge the shards into the embedding matrix and remove them; returns the stored count."""
+    if not list(shards_dir.glob('part-*.npz')):
+        path = data_dir / KEYS_PATH.name
+        return len(np.load(path)) if path.is_file() else 0
+    keys, blocks = [], []
+    for block_keys, vectors in _stored_embeddings(data_dir, shards_dir):
+        keys.append(block_keys)
+        blocks.append(np.asarray(vectors, dtype=np.float16))
+    if not keys:
+        return 0
+    keys = np.concatenate(keys)
+    vectors = np.concatenate(blocks)
+    # Later blocks win when an image was embedded twice
+    _, last = np.unique(keys[::-1], return_index=True)
+    keep = np.sort(len(keys) - 1 - last)
+    save_embeddings(vectors[keep], keys[keep], model, data_dir)
+    shutil.rmtree(shards_dir, ignore_errors=True)
+    # Row ids changed, so an existing IVF index no longer matches the matrix
+    (data_dir / IVF_PATH.name).unlink(missing_ok=True)
+    return len(keep)
+
+
+def embed(images_dir=None, workers=None, batch_size=32, model=None, data_dir=DATA_DIR,
+          shards_dir=SHARDS_DIR):
+    """Encode every image of ``df.csv`` that has no stored embedding yet."""
+    from .clip_model import MODEL_NAME
+
+    model = model or MODEL_NAME
+    workers = workers or max(1, (os.cpu_count() or 1) // 2)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+
+    done = set()
+    for block_keys, _ in _stored_embeddings(data_dir, shards_dir):
+        done.update(block_keys.tolist())
+
+    df = load_images()
+    todo, seen = [], set(done)
+    for row in df[['original_file_name', 'full_url']].to_dict('records'):
+        key = cache_key(row['original_file_name'])
+        if key not in seen:
+            seen.add(key)
+            todo.append((key, row))
+    print(f"{len(done)} images already embedded, {len(todo)} to go")
+
+    batches = [todo[start:start + batch_size] for start in range(0, len(todo), batch_size)]
+    embedded = 0
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(model, threads)) as pool:
+        futures = [pool.submit(_embed_batch, batch, images_dir) for batch in batches]
+        for future in as_completed(futures):
+            keys, vectors, failures = future.result()
+            for file_name, error in failures:
+                print(f"skipping {file_name}: {error}")
+            if keys:
+                _write_shard(keys, vectors, shards_dir)
+                embedded += len(keys)
+                print(f"embedded {embedded}/{len(todo)} images")
+    return consolidate(model, data_dir, shards_dir)
+
+
+def category_scores(embeddings, text_vectors):
+    """Score every embedding against each category vector; the last text vector is the baseline."""
+    scores = np.empty((len(embeddings), len(text_vectors) - 1), dtype=np.float32)
+    for start in range(0, len(embeddings), SEARCH_BATCH):
+        similarities = np.asarray(embeddings[start:start + SEARCH_BATCH], dtype=np.float32) @ text_vectors.T
+        logits = LOGIT_SCALE * (similarities[:, :-1] - similarities[:, -1:])
+        scores[start:start + SEARCH_BATCH] = 1.0 / (1.0 + np.exp(-logits))
+    return scores
+
+
+def score(categories, prompt=PROMPT, overwrite=False, csv_path=IMAGE_CSV):
+    """Append one score column per category to ``df.csv``; images without an embedding get NaN."""
+    from .clip_model import encode_texts
+
+    store = load_embedding_store(csv_path)
+    if store is None:
+        raise SystemExit("no stored embeddings; run `python -m app.helpers.scoring embed` first")
+
+    raw = pd.read_csv(csv_path)
+    if not overwrite:
+        existing = [category for category in categories if category in raw.columns]
+        for category in existing:
+            print(f"skipping '{category}': column exists (use --overwrite to rescore)")
+        categories = [category for category in categories if category not in raw.columns]
+    if not categories:
+        return []
+
+    text_vectors = encode_texts([prompt.format(category) for category in categories] + [BASELINE_PROMPT],
+                                store.model)
+    scores = category_scores(store.embeddings, text_vectors)
+    # Every row of df.csv looks up its file's embedding; rows sharing a file share its scores
+    embedding_rows = {key: row for row, key in enumerate(store.keys)}
+    rows = raw['original_file_name'].map(cache_key).map(embedding_rows).to_numpy(dtype=np.float64)
+    present = ~np.isnan(rows)
+    for column, category in enumerate(categories):
+        values = np.full(len(raw), np.nan, dtype=np.float32)
+        values[present] = scores[rows[present].astype(np.int64), column]
+        raw[category] = values.round(4)
+
+    write_csv(raw, csv_path)
+    return categories
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="CLIP scoring pipeline for data/df.csv (CPU only).")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    embed_parser = commands.add_parser('embed', help="encode images that have no stored embedding yet")
+    embed_parser.add_argument('--images-dir', help="local copy of the release; missing files are downloaded")
+    embed_parser.add_argument('--workers', type=int, help="encoder processes (default: half the CPUs)")
+    embed_parser.add_argument('--batch-size', type=int, default=32)
+    embed_parser.add_argument('--ivf-lists', type=int, default=0,
+                              help="also build an IVF index with this many lists (0 = exact search only)")
+
+    score_parser = commands.add_parser('score', help="add category columns from the stored embeddings")
+    score_parser.add_argument('categories', nargs='+')
+    score_parser.add_argument('--prompt', default=PROMPT, help="text template, {} is the category")
+    score_parser.add_argument('--overwrite', action='store_true', help="rescore existing columns")
+
+    args = parser.parse_args(argv)
+    if args.command == 'embed':
+        total = embed(args.images_dir, args.workers, args.batch_size)
+        if args.ivf_lists:
+            IVFIndex.train(np.load(EMBEDDINGS_PATH, mmap_mode='r'), args.ivf_lists).save(IVF_PATH)
+        print(f"{total} embeddings stored in {EMBEDDINGS_PATH}")
+    else:
+        added = score(args.categories, args.prompt, args.overwrite)
+        print(f"added {len(added)} columns to {IMAGE_CSV}: {', '.join(added)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+"""Server-side thumbnail stage for the image grids.
+
+Originals are decoded at reduced size (JPEG draft mode plus Pillow's
+reduce-on-load) and re-encoded as fixed-width WebP, falling back to JPEG
+where Pillow lacks WebP support.  Thumbnails are produced on the fetch
+workers, kept in the disk cache and are the only thing sent to the browser.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from PIL import Image, features
+
+from .cache import THUMBNAILS, cache_key, get_cache
+from .fetch import MAX_WORKERS, FetchResult, fetch_all
+from .metrics import timed
+
+THUMBNAIL_WIDTH = int(os.environ.get("ABBOTTABAD_THUMBNAIL_WIDTH", "320"))
+THUMBNAIL_FORMAT = "WEBP" if features.check("webp") else "JPEG"
+THUMBNAIL_QUALITY = 80
+
+# Seconds a background prefetch batch may spend downloading
+PREFETCH_DEADLINE = float(os.environ.get("ABBOTTABAD_PREFETCH_DEADLINE", "15"))
+
+# Very tall images (scans, screenshots) are cropped to this multiple of the width
+MAX_ASPECT = 3
+
+
+def thumbnail_namespace(width=THUMBNAIL_WIDTH, format=THUMBNAIL_FORMAT):
+    """Cache namespace for one thumbnail size/format, so changing either never serves stale files."""
+    return f"{THUMBNAILS}-{width}-{format.lower()}"
+
+
+def make_thumbnail(content, width=THUMBNAIL_WIDTH, format=THUMBNAIL_FORMAT):
+    """Decode ``content`` at reduced size and return a ``width``-pixel wide thumbnail."""
+    with timed('decode'):
+        image = Image.open(BytesIO(content))
+        # JPEG: let the decoder scale by 1/2, 1/4 or 1/8 instead of decoding full size.  The box
+        # keeps the image's aspect ratio, since draft() only scales while both sides stay inside it
+        image.draft("RGB", (width, max(1, width * image.height // max(1, image.width))))
+        if image.width > width:
+            # reducing_gap makes Pillow reduce() on load before the final resample
+            image.thumbnail((width, image.height), reducing_gap=2.0)
+        if image.height > width * MAX_ASPECT:
+            image = image.crop((0, 0, image.width, width * MAX_ASPECT))
+        if image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+    with timed('encode'):
+        buffer = BytesIO()
+        image.save(buffer, format=format, quality=THUMBNAIL_QUALITY)
+    return buffer.getvalue()
+
+
+def fetch_thumbnails(urls, cache=None, width=THUMBNAIL_WIDTH, max_workers=MAX_WORKERS, deadline=None):
+    """Yield a ``FetchResult`` holding thumbnail bytes for each of ``urls``.
+
+    Cached thumbnails are yielded first without touching the network; the
+    rest are downloaded (until ``deadline``), thumbnailed on the worker
+    threads and cached.
+    """
+    cache = cache or get_cache()
+    namespace = thumbnail_namespace(width)
+    urls = list(urls)
+
+    missing = []
+    for position, url in enumerate(urls):
+        thumbnail = cache.get(namespace, cache_key(url))
+        if thumbnail is None:
+            missing.append(position)
+        else:
+            yield FetchResult(position, url, content=thumbnail)
+
+    def _thumbnail(url, content):
+        thumbnail = make_thumbnail(content, width)
+        cache.put(namespace, cache_key(url), thumbnail)
+        return thumbnail
+
+    for result in fetch_all([urls[position] for position in missing], max_workers=max_workers,
+                            cache=cache, transform=_thumbnail, deadline=deadline):
+        result.position = missing[result.position]
+        yield result
+
+
+# One background worker warms the cache for the page the user is likely to open next
+_prefetch_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="thumbnail-prefetch")
+# Latest batch per owner (a session); a newer batch supersedes it
+_prefetch_batches = {}
+_prefetch_lock = threading.Lock()
+
+
+class _PrefetchBatch:
+    def __init__(self, urls):
+        self.urls = urls
+        self.cancelled = threading.Event()
+        self.future = None
+
+    def cancel(self):
+        self.cancelled.set()
+        if self.future is not None:
+            self.future.cancel()
+
+
+def prefetch_thumbnails(urls, width=THUMBNAIL_WIDTH, owner=None):
+    """Build and cache thumbnails for ``urls`` in the background.
+
+    Each ``owner`` (e.g. a session) has at most one batch queued or running.
+    A new batch drops the owner's previous one: before it starts, or after
+    its current round of ``MAX_WORKERS`` downloads.  A batch gives up
+    ``PREFETCH_DEADLINE`` seconds after it starts.
+    """
+    urls = tuple(urls)
+    if not urls:
+        return
+    with _prefetch_lock:
+        current = _prefetch_batches.get(owner)
+        if current is not None:
+            if current.urls == urls:
+                return
+            current.cancel()
+        batch = _prefetch_batches[owner] = _PrefetchBatch(urls)
+
+    def _run():
+        deadline = time.monotonic() + PREFETCH_DEADLINE
+        try:
+            for start in range(0, len(urls), MAX_WORKERS):
+                if batch.cancelled.is_set() or time.monotonic() >= deadline:
+                    break
+                for _ in fetch_thumbnails(urls[start:start + MAX_WORKERS], width=width, deadline=deadline):
+                    pass
+        finally:
+            with _prefetch_lock:
+                if _prefetch_batches.get(owner) is batch:
+                    del _prefetch_batches[owner]
+
+    with _prefetch_lock:
+        if not batch.cancelled.is_set():
+            batch.future = _prefetch_pool.submit(_run)
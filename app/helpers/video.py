@@ -0,0 +1,193 @@
+"""Offline video probing, poster frames and low-bitrate previews.
+
+For every video in ``video_data.csv`` a process pool runs ffmpeg (the binary
+bundled with moviepy through imageio-ffmpeg, or ``ffmpeg`` on the PATH) to
+
+* probe duration, codec, resolution and the container's creation time,
+* grab a poster frame as a small JPEG,
+* encode a short, silent H.264 MP4 preview that every browser can play.
+
+Results go to ``data/video_previews/<hash>.jpg|.mp4`` and one row per video
+in ``data/video_info.csv``; rows are appended as they finish, so a rerun only
+processes new videos.  The video page shows the posters and loads a preview
+only when it is clicked.
+
+Run from the repository root::
+
+    python -m app.helpers.video --workers 4
+"""
+import argparse
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
+import pandas as pd
+
+from .cache import cache_key
+from .data import DATA_DIR, VIDEO_CSV, memoized
+from .client import get_client
+from .mirror import local_copy
+
+PREVIEWS_DIR = DATA_DIR / 'video_previews'
+INFO_CSV = DATA_DIR / 'video_info.csv'
+INFO_COLUMNS = ['key', 'original_file_name', 'duration', 'codec', 'width', 'height', 'creation_time',
+                'poster', 'preview']
+
+POSTER_WIDTH = 320
+PREVIEW_HEIGHT = 240
+PREVIEW_SECONDS = 8
+PREVIEW_BITRATE = '250k'
+
+_DURATION = re.compile(r"Duration: (\d+):(\d+):(\d+(?:\.\d+)?)")
+_VIDEO_STREAM = re.compile(r"Stream #.*?: Video: (\w+)[^\n]*?, (\d{2,5})x(\d{2,5})")
+_CREATION_TIME = re.compile(r"creation_time\s*:\s*(\S+)")
+
+
+def ffmpeg_binary():
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except ImportError:
+        return shutil.which('ffmpeg') or 'ffmpeg'
+
+
+def _run(arguments, timeout=300):
+    return subprocess.run([ffmpeg_binary(), '-hide_banner', *arguments], capture_output=True,
+                          text=True, errors='replace', timeout=timeout)
+
+
+def probe(path):
+    """Duration (s), codec, width, height and creation time parsed from ffmpeg's stream info."""
+    # Without an output ffmpeg exits non-zero, but it has printed the stream info by then
+    output = _run(['-i', str(path)]).stderr
+    info = {'duration': None, 'codec': None, 'width': None, 'height': None, 'creation_time': None}
+    match = _DURATION.search(output)
+    if match:
+        hours, minutes, seconds = match.groups()
+        info['duration'] = int(hours) * 3600 + int(minutes) * 60 + float(seconds)
+    match = _VIDEO_STREAM.search(output)
+    if match:
+        info['codec'] = match.group(1)
+        info['width'], info['height'] = int(match.group(2)), int(match.group(3))
+    match = _CREATION_TIME.search(output)
+    if match:
+        info['creation_time'] = match.group(1)
+    return info
+
+
+def make_poster(path, output, duration=None):
+    """Write a ``POSTER_WIDTH`` JPEG frame taken a little way into the video."""
+    offset = min(1.0, duration / 2) if duration else 0
+    result = _run(['-y', '-ss', f'{offset:.2f}', '-i', str(path), '-frames:v', '1',
+                   '-vf', f'scale={POSTER_WIDTH}:-2', '-q:v', '5', str(output)])
+    return result.returncode == 0 and Path(output).is_file()
+
+
+def make_preview(path, output):
+    """Encode the first ``PREVIEW_SECONDS`` as a small, silent, streamable MP4."""
+    result = _run(['-y', '-i', str(path), '-t', str(PREVIEW_SECONDS), '-an',
+                   '-vf', f'scale=-2:{PREVIEW_HEIGHT}', '-c:v', 'libx264', '-preset', 'veryfast',
+                   '-b:v', PREVIEW_BITRATE, '-pix_fmt', 'yuv420p', '-movflags', '+faststart', str(output)])
+    return result.returncode == 0 and Path(output).is_file()
+
+
+def _source(row, workdir):
+    """Local path of a video: the mirror if present, otherwise a streamed download."""
+    mirrored = local_copy(row['original_file_name'])
+    if mirrored is not None:
+        return mirrored
+    path = Path(workdir) / 'source'
+    with get_client().get(row['full_url'], timeout=60, stream=True) as response:
+        response.raise_for_status()
+        with open(path, 'wb') as file:
+            for chunk in response.iter_content(1024 * 1024):
+                file.write(chunk)
+    return path
+
+
+def process_video(row, previews_dir=PREVIEWS_DIR):
+    """Worker: probe one video and build its poster and preview; returns an info row."""
+    key = cache_key(row['original_file_name'])
+    previews_dir = Path(previews_dir)
+    previews_dir.mkdir(parents=True, exist_ok=True)
+    # Work next to the outputs so finished files can be moved into place atomically
+    with tempfile.TemporaryDirectory(dir=previews_dir, prefix='.work-') as workdir:
+        source = _source(row, workdir)
+        info = probe(source)
+        poster = previews_dir / f'{key}.jpg'
+        preview = previews_dir / f'{key}.mp4'
+        poster_tmp = Path(workdir) / 'poster.jpg'
+        preview_tmp = Path(workdir) / 'preview.mp4'
+        has_poster = make_poster(source, poster_tmp, info['duration'])
+        if has_poster:
+            os.replace(poster_tmp, poster)
+        has_preview = make_preview(source, preview_tmp)
+        if has_preview:
+            os.replace(preview_tmp, preview)
+    return {'key': key, 'original_file_name': row['original_file_name'], **info,
+            'poster': has_poster, 'preview': has_preview}
+
+
+def _append_info(rows, info_csv):
+    frame = pd.DataFrame(rows, columns=INFO_COLUMNS)
+    frame.to_csv(info_csv, mode='a', header=not Path(info_csv).is_file(), index=False)
+
+
+def _read_info(info_csv):
+    info = pd.read_csv(info_csv, dtype={'key': str})
+    return info.drop_duplicates('key', keep='last').set_index('key')
+
+
+def build(workers=None, csv_path=VIDEO_CSV, info_csv=INFO_CSV, previews_dir=PREVIEWS_DIR):
+    """Process every video without an info row; returns ``(processed, failed)`` counts."""
+    df = pd.read_csv(csv_path, usecols=['original_file_name', 'full_url']).drop_duplicates('original_file_name')
+    done = set(_read_info(info_csv).index) if Path(info_csv).is_file() else set()
+    todo = [row for row in df.to_dict('records') if cache_key(row['original_file_name']) not in done]
+    print(f"{len(done)} videos already processed, {len(todo)} to go")
+
+    processed = failed = 0
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures = {pool.submit(process_video, row, previews_dir): row for row in todo}
+        for future in as_completed(futures):
+            try:
+                _append_info([future.result()], info_csv)
+            except Exception as e:
+                failed += 1
+                print(f"failed {futures[future]['original_file_name']}: {e}")
+                continue
+            processed += 1
+            print(f"processed {processed}/{len(todo)} videos")
+    return processed, failed
+
+
+def load_video_info(info_csv=INFO_CSV):
+    """Probe results indexed by content hash, or ``None`` before the offline step has run."""
+    if not Path(info_csv).is_file():
+        return None
+    return memoized(('video_info', str(info_csv)), info_csv, lambda: _read_info(info_csv))
+
+
+def poster_path(key, previews_dir=PREVIEWS_DIR):
+    path = Path(previews_dir) / f'{key}.jpg'
+    return path if path.is_file() else None
+
+
+def preview_path(key, previews_dir=PREVIEWS_DIR):
+    path = Path(previews_dir) / f'{key}.mp4'
+    return path if path.is_file() else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Probe videos and build posters and previews.")
+    parser.add_argument('--workers', type=int, help="parallel ffmpeg processes (default: all CPUs)")
+    args = parser.parse_args(argv)
+    processed, failed = build(args.workers)
+    print(f"processed {processed} videos, {failed} failed")
+
+
+if __name__ == '__main__':
+    main()
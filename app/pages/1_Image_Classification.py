@@ -1,18 +1,22 @@
 import streamlit as st
-import pandas as pd
-import requests
-from PIL import Image
-from io import BytesIO
-from pathlib import Path
 
-st.set_page_config(page_title="Image Classification Results")
+from helpers.clip_model import encode_query
+from helpers.data import load_images, score_columns
+from helpers.debug import debug_panel
+from helpers.embeddings import load_embedding_store
+from helpers.export import export_panel
+from helpers.grid import show_image_grid
+from helpers.metrics import timed
+from helpers.phash import collapse_duplicates, load_frame_duplicates, with_duplicate_count
+from helpers.score_index import AND, OR, load_score_index
 
-# base_directory
-pages_directory = Path.cwd()
-base_directory = pages_directory
+st.set_page_config(page_title="Image Classification Results")
+debug_panel()
 
-# Load DataFrame
-df = pd.read_csv(f'{base_directory}/data/df.csv')
+# Load DataFrame and its score index (typed and cached per process)
+df = load_images()
+score_index = load_score_index()
+duplicates = load_frame_duplicates('images', df)
 
 st.title("Image Classification Results")
 st.markdown("""            
@@ -33,7 +37,10 @@ with st.expander("Click here for more information on how to use the image filter
 
     1.	__Select Category__: Choose a keyword category from the sidebar dropdown.
     2.	__Set Threshold__: Adjust the threshold slider to filter images based on the classification score. 
-    3.	__View Images__: Browse the grid of images that meet the criteria. Each image displays the file name and its score for the selected category.
+    3.	__View Images__: Browse the grid of images that meet the criteria, best scores first. Each image displays the file name and its score for the selected category.
+    4.	__Combine Categories__ (optional): Add more categories with their own thresholds and choose whether images must match all or any of them, or keep only the top K images.
+    5.	__Free Text__ (optional): Switch the search to free text and describe any concept; images are ranked by their CLIP similarity to the description.
+    6.	__Duplicates__ (optional): Collapse near-duplicate copies of the same picture into one image, or switch the search to similar images and enter a file name to list its copies.
 
     Example Use Case
     - __Objective__: Identify images that prominently feature “eyes” with a high degree of confidence.
@@ -50,49 +57,103 @@ with st.expander("Click here for more information on how to use the image filter
 with st.sidebar.title("Image Filter"):
     st.write("Select a category and a threshold to filter images")
 
-sorted_columns = sorted(df.columns[15:])
+search_modes = ["Category scores", "Free text"] + (["Similar images"] if duplicates is not None else [])
+search_mode = st.sidebar.radio("Search by", search_modes)
+
+# Near-duplicates (re-encoded or resized copies) share a cluster in the perceptual-hash index
+collapse = duplicates is not None and st.sidebar.checkbox("Collapse near-duplicates", value=True)
+
+def collapsed(rows):
+    return collapse_duplicates(rows, duplicates) if collapse else rows
+
+if search_mode == "Similar images":
+    # Hamming-distance lookup of one image's perceptual hash
+    file_name = st.sidebar.text_input("File name", placeholder="e.g. the file name shown below an image")
+    if not file_name:
+        st.info("Enter the file name of an image to list its near-duplicates.")
+        st.stop()
+    matches = df[df['new_file_name'] == file_name.strip()]
+    if matches.empty:
+        st.warning(f"No image named '{file_name}'.")
+        st.stop()
+    with timed('filter', page='classification', mode='similar'):
+        # Closest first, as returned by the index
+        filtered_df = df.iloc[duplicates.similar_rows(matches['original_file_name'].iloc[0])]
+    export_panel(filtered_df, f"similar {file_name}", key='classification')
+
+    st.subheader(f"Images similar to '{file_name}'")
+    with st.spinner("Loading images ..."):
+        st.write(' ')
+        show_image_grid(filtered_df, lambda row: row['new_file_name'], key=f"similar-{file_name}")
+    st.stop()
+
+if search_mode == "Free text":
+    # Semantic search: embed the query once, then cosine top-K over the stored CLIP embeddings
+    embedding_store = load_embedding_store()
+    if embedding_store is None:
+        st.info("Free-text search needs the stored CLIP embeddings. "
+                "Run `python -m app.helpers.scoring embed` once to create them.")
+        st.stop()
+    query = st.sidebar.text_input("Describe what to look for", placeholder="e.g. a man holding a rifle")
+    num_results = st.sidebar.slider("Number of results", min_value=10, max_value=500, value=60, step=10)
+    if not query:
+        st.info("Type a description in the sidebar to search all images.")
+        st.stop()
+    try:
+        with timed('encode_query'):
+            query_vector = encode_query(query, embedding_store.model)
+    except ImportError:
+        st.info("Free-text search needs the optional CLIP packages on the server: "
+                "`pip install torch transformers`.")
+        st.stop()
+    with timed('filter', page='classification', mode='text'):
+        rows, similarities = embedding_store.search(query_vector, k=num_results)
+        filtered_df = collapsed(df.iloc[rows].assign(similarity=similarities))
+    export_panel(filtered_df, f"text {query}", key='classification')
+
+    st.subheader(f"Images matching '{query}'")
+    with st.spinner("Loading images ..."):
+        st.write(' ')
+        show_image_grid(filtered_df,
+                        with_duplicate_count(lambda row: f"{row['new_file_name']} - similarity: {row['similarity']:.2f}"),
+                        key=f"text-{query}-{num_results}-{collapse}")
+    st.stop()
+
+sorted_columns = sorted(score_columns(df))
 category = st.sidebar.selectbox("Select category", sorted_columns)
 threshold = st.sidebar.slider("Select threshold", min_value=0.0, max_value=1.0, 
                               value=0.8, step=0.01)
+conditions = [(category, threshold)]
+
+# Optional extra categories, e.g. eye >= 0.8 AND mask >= 0.5
+with st.sidebar.expander("Combine with more categories"):
+    extra_categories = st.multiselect("Additional categories",
+                                      [column for column in sorted_columns if column != category])
+    for extra_category in extra_categories:
+        extra_threshold = st.slider(f"Threshold for '{extra_category}'", min_value=0.0, max_value=1.0,
+                                    value=0.5, step=0.01)
+        conditions.append((extra_category, extra_threshold))
+    match_mode = st.radio("Images must match", ["all categories (AND)", "any category (OR)"])
+mode = OR if match_mode.startswith("any") else AND
 
-# Filter DataFrame based on selected category and threshold
-filtered_df = df[df[category] >= threshold]
+top_k = st.sidebar.number_input("Show only the top K images (0 for all)", min_value=0, value=0, step=10)
 
-st.subheader(f"Images for category '{category}' with score above {threshold}")
+# Look up matching rows in the score index, ranked by score
+with timed('filter', page='classification', mode='scores'):
+    rows = score_index.query(conditions, mode=mode, limit=top_k or None)
+    filtered_df = collapsed(df.iloc[rows])
 
-headers = {
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-    "Referer": "https://abbottabadcompoundmaterial.streamlit.app/",
-    # "Accept-Encoding": "gzip, deflate, br",
-}
+# Zip the matching images with a manifest of their scores
+export_panel(filtered_df, f"images {category}", key='classification')
+
+query_text = f" {mode.upper()} ".join(f"'{column}' >= {value}" for column, value in conditions)
+st.subheader(f"Images for {query_text}")
+
+def image_caption(row):
+    scores = ", ".join(f"{column}: {row[column]:.2f}" for column, _ in conditions)
+    return f"{row['new_file_name']} - score: {scores}"
 
 with st.spinner("Loading images ..."):
-    url = "https://www.cia.gov/library/abbottabad-compound/" 
-    session = requests.Session() 
     st.write(' ')
-    # Display images in a grid
-    num_columns = 3
-    columns = st.columns(num_columns)
-
-    for idx, row in filtered_df.iterrows():
-        try:
-            file_name = row['new_file_name']  
-            image_url = row['full_url']  
-            session.headers.update(headers)
-            response = session.get(image_url, 
-                                #    headers=headers, 
-                                   timeout=30,
-                                    stream=True)
-            # response = requests.get(image_url, headers=headers, timeout=30)
-            response.raise_for_status()
-            image = Image.open(BytesIO(response.content))
-            column = columns[idx % num_columns]
-            column.image(image, caption=f"{file_name} - score: {row[category]:.2f}", 
-                         use_column_width=True)
-
-        except Exception as e:
-            st.error(f"Error loading image: {e}")    
-        except requests.exceptions.RequestException as e:
-            # logging.error(f"Error fetching image from URL: {e}")
-            st.error(f"Error loading image: cannot fetch from URL {image_url}")
-
+    # Display the current page of images in a grid, fetched concurrently
+    show_image_grid(filtered_df, with_duplicate_count(image_caption), key=f"{query_text}-{top_k}-{collapse}")
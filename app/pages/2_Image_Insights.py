@@ -1,12 +1,17 @@
 import streamlit as st
 import pandas as pd
-from pathlib import Path
 import plotly.graph_objects as go
-import requests
-from PIL import Image
-from io import BytesIO
+
+from helpers.crossfilter import load_image_filter
+from helpers.debug import debug_panel
+from helpers.export import export_panel
+from helpers.grid import show_image_grid
+from helpers.metrics import timed
+from helpers.phash import collapse_duplicates, load_frame_duplicates, with_duplicate_count
+from helpers.rollups import load_image_rollup
 
 st.set_page_config(page_title="Image Insights")
+debug_panel()
 st.title("Image Metadata Insights")
 st.markdown("""
             This application provides insights into all images from the compound files where metadata regarding time and/or camera could be extracted. 
@@ -25,9 +30,10 @@ with st.expander("Click here for more information on using the date filter and m
     <h4>How to Use</h4>
 
     1. __Select Date Range__: Use the date input fields in the sidebar to specify a start and end date for filtering images.
-    2. __Display Metadata__: Toggle the "Display camera, date, and time information" option to choose whether to show camera make, date, and time details below each image.
+    2. __Display Metadata__: Toggle the "Display camera, date, and time information" option to choose whether to show camera make, date, and time details below each image. You can then narrow the images down by camera make and model; the number next to each option is how many images it matches within the other filters.
     3. __Browse Images__: Scroll through the grid of images within the selected date range. Each image is captioned with its file name and any available metadata.
     4. __Adjust Date Range__: You can dynamically update the date range by changing the start and end dates in the sidebar, and the app will respond accordingly.
+    5. __Collapse Near-Duplicates__: Show one image per group of re-encoded or resized copies; the caption tells how many copies are hidden.
 
 
     Example Use Case
@@ -39,139 +45,84 @@ with st.expander("Click here for more information on using the date filter and m
     """
     st.markdown(functionality_text, unsafe_allow_html=True)
 
-# base_directory
-pages_directory = Path.cwd()
-base_directory = pages_directory
-
-# Load and filter DataFrame
-df_data = pd.read_csv(f'{base_directory}/data/df.csv')
-# Filter out rows with NaN values in  'timestamp'  and reset index
-df_timestamp = df_data.dropna(subset=['timestamp'])
-df_timestamp.reset_index(inplace=True)
-# Select specific columns
-filtered_columns = ['new_file_name', 'full_url', 'timestamp', 'camera_make', 'camera_model']
-# Convert 'timestamp' column to datetime format
-df = df_timestamp[filtered_columns]
-df['timestamp'] = pd.to_datetime(df['timestamp'], format='%Y:%m:%d %H:%M:%S', errors='coerce')
-df = df[df['timestamp'].notna()]
-
-# Replace variants of manufacturers with common labels
-manufacturer_mapping = {
-    'canon': 'Canon',
-    'olympus': 'Olympus',
-    'nokia': 'Nokia',
-    'sony': 'Sony',
-    'nikon': 'Nikon',
-    'fujifilm': 'Fujifilm',
-    'casio': 'Casio',
-    'hewlett-packard': 'HP',
-    'hp': 'HP',
-    'samsung': 'Samsung',
-    'konica': 'Konica',
-    'panasonic': 'Panasonic',
-    'pentax': 'Pentax',
-}
-
-df['camera_make'] = df['camera_make'].str.lower().map(manufacturer_mapping).fillna('Other')
+# Load the cross filter: images with a valid timestamp sorted by time, indexed by camera make and model
+image_filter = load_image_filter()
 
 # Sidebar user inputs
 st.sidebar.title("Data Filter")
 st.sidebar.write("Select a date range to filter images")
 
 start_date = st.sidebar.date_input("Type or select start date", 
-                                   min_value=df['timestamp'].min().date(), 
-                                   max_value=df['timestamp'].max().date(),
-                                   value=df['timestamp'].min().date())
+                                   min_value=image_filter.min_date, 
+                                   max_value=image_filter.max_date,
+                                   value=image_filter.min_date)
 end_date = st.sidebar.date_input("Type or select end date", 
-                                 min_value=df['timestamp'].min().date(), 
-                                 max_value=df['timestamp'].max().date(),
-                                 value=df['timestamp'].max().date())
-
-# Filter df based on user inputs
-filtered_df = df[(df['timestamp'] >= pd.to_datetime(start_date, format='%Y:%m:%d %H:%M:%S', errors='coerce')) & 
-                 (df['timestamp'] <= pd.to_datetime(end_date, format='%Y:%m:%d %H:%M:%S', errors='coerce'))]
+                                 min_value=image_filter.min_date, 
+                                 max_value=image_filter.max_date,
+                                 value=image_filter.max_date)
 
 # Sidebar for filtering camera makes and models
 camera_info_on = st.sidebar.checkbox('Display camera, date and time information (if available)')
+camera_makes, camera_models = [], []
 
 if camera_info_on:
-    camera_makes = st.sidebar.multiselect("Select camera makes", df['camera_make'].unique())
+    # Each option shows its number of images under the other filters (the end date is included as a whole day)
+    selected_models = st.session_state.get('camera-models', []) if st.session_state.get('camera-makes') else []
+    make_counts = image_filter.facet_counts('camera_make', start_date, end_date, camera_model=selected_models)
+    camera_makes = st.sidebar.multiselect("Select camera makes", image_filter.values('camera_make'),
+                                          format_func=lambda make: f"{make} ({make_counts.get(make, 0)})",
+                                          key='camera-makes')
     if camera_makes:
-        filtered_df = filtered_df[filtered_df['camera_make'].isin(camera_makes)]
-        
-        # Update camera model options based on selected makes
-        available_models = filtered_df['camera_model'].unique()
-        camera_models = st.sidebar.multiselect("Select camera models", available_models)
-        if camera_models:
-            filtered_df = filtered_df[filtered_df['camera_model'].isin(camera_models)]
-
-# Group by date and count occurrences
-occurrences = filtered_df['timestamp'].dt.date.value_counts().sort_index()
+        # Camera model options: models of the selected makes within the date range
+        model_counts = image_filter.facet_counts('camera_model', start_date, end_date, camera_make=camera_makes)
+        available_models = [model for model in image_filter.values('camera_model')
+                            if model_counts[model] or model in selected_models]
+        camera_models = st.sidebar.multiselect("Select camera models", available_models,
+                                               format_func=lambda model: f"{model} ({model_counts[model]})",
+                                               key='camera-models')
+
+# Filter by row ids: the date range is a slice of the time-sorted rows, makes and models are bitmaps
+with timed('filter', page='insights'):
+    rows = image_filter.query(start_date, end_date, camera_make=camera_makes, camera_model=camera_models)
+    filtered_df = image_filter.take(rows)
+
+# Count images per day, week or month (depending on the span) from the precomputed rollup
+with timed('rollup', page='insights'):
+    dates, counts, granularity = load_image_rollup().counts(start_date, end_date, camera_makes, camera_models)
 
 # Create a time series plot using Plotly Graph Objects
-fig = go.Figure(data=[go.Scatter(x=occurrences.index, y=occurrences.values, mode='lines+markers')])
+fig = go.Figure(data=[go.Scatter(x=dates, y=counts, mode='lines+markers')])
 fig.update_layout(
     title='Number Of Images Over Selected Time Period',
-    xaxis_title='Date',
+    xaxis_title=f'Date (per {granularity})',
     yaxis_title='Count',
     xaxis=dict(tickformat='%Y-%m-%d'),
 )
-st.plotly_chart(fig, use_container_width=True)
+st.plotly_chart(fig, width='stretch')
 
 st.subheader(f"Images from {start_date} to {end_date}")
 
-headers = {
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36",
-    "Referer": "https://abbottabadcompoundmaterial.streamlit.app/",
-    # "Accept-Encoding": "gzip, deflate, br",
-}
+# Show one representative per near-duplicate cluster (the plot above still counts every copy)
+duplicates = load_frame_duplicates('image_filter', image_filter.frame)
+collapse = duplicates is not None and st.sidebar.checkbox("Collapse near-duplicates", value=True)
+if collapse:
+    with timed('filter', page='insights'):
+        filtered_df = collapse_duplicates(filtered_df, duplicates)
+
+# Zip the images of the date range with a manifest of their metadata
+export_panel(filtered_df, f"images {start_date} {end_date}", key='insights')
+
+def image_caption(row):
+    file_name = row['new_file_name']
+    if not camera_info_on:
+        return f"{file_name} "
+    camera_make = '- Camera: ' + str(row['camera_make'])
+    camera_model = str(row['camera_model'])
+    timestamp = '- Date: ' + str(row['timestamp'])
+    return f"{file_name} {camera_make} {camera_model if not pd.isnull(row['camera_model']) else ' '} {timestamp}"
 
 with st.spinner("Loading images ..."):
-    url = "https://www.cia.gov/library/abbottabad-compound/" 
-    session = requests.Session() 
     st.write(' ')
-    # Display images in a grid
-    num_columns = 3
-    columns = st.columns(num_columns)
-
-    for idx, row in filtered_df.iterrows():
-        try:
-            file_name = row['new_file_name']  
-            image_url = row['full_url'] 
-            session.headers.update(headers) 
-            response = requests.get(image_url, 
-                                    # headers=headers, 
-                                    timeout=30,
-                                    stream=True)
-            
-            if response.status_code == 200 and response.headers["Content-Type"].startswith("image/"):
-                # with open("image.jpg", "wb") as file:
-                #     for chunk in response.iter_content(1024):
-                #         file.write(chunk)
-
-                # try:
-                #     with Image.open("image.jpg") as img:
-                #         img.verify()
-                #     print("Image is valid.")
-                # except (IOError, SyntaxError) as e:
-                #     print(f"Image is broken: {e}")
-
-                ###
-                image = Image.open(BytesIO(response.content))
-                column = columns[idx % num_columns]
-                if camera_info_on:
-                    camera_make = '- Camera: ' + str(row['camera_make'])
-                    camera_model = str(row['camera_model'])
-                    timestamp = '- Date: ' + str(row['timestamp'])
-                    column.image(image, caption=f"{file_name} {camera_make} {camera_model if not pd.isnull(row['camera_model']) else ' '} {timestamp}", 
-                                use_column_width=True)
-                else:
-                    column.image(image, caption=f"{file_name} ", use_column_width=True)
-                ####
-                
-        except Exception as e:
-            st.error(f"Error loading image: {e}, {image_url}")
-        except requests.exceptions.RequestException as e:
-            # logging.error(f"Error fetching image from URL: {e}")
-            st.error(f"Error loading image: cannot fetch from URL {image_url}")
-
+    # Display the current page of images in a grid, fetched concurrently
+    show_image_grid(filtered_df, with_duplicate_count(image_caption),
+                    key=f"{start_date}-{end_date}-{camera_info_on}-{collapse}")
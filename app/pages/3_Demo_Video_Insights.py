@@ -1,75 +1,131 @@
 import streamlit as st
 import pandas as pd
-from pathlib import Path
 import plotly.graph_objects as go
 
-# Base directory
-pages_directory = Path.cwd()
-base_directory = pages_directory
+from helpers.cache import cache_key
+from helpers.crossfilter import load_video_filter
+from helpers.debug import debug_panel
+from helpers.export import export_panel
+from helpers.grid import PAGE_SIZE
+from helpers.metrics import timed
+from helpers.mirror import local_copy
+from helpers.video import load_video_info, poster_path, preview_path
+from helpers.rollups import load_video_rollup
 
 st.set_page_config(page_title="Demo: Video Insights")
+debug_panel()
 st.title("Video Insights")
 
-# Load video data
-df_data = pd.read_csv(f'{base_directory}/data/video_data.csv')
-
-# Filter out rows with NaN values in 'timestamp' and reset index
-df_timestamp = df_data.dropna(subset=['timestamp'])
-df_timestamp.reset_index(inplace=True, drop=True)
-
-# Ensure that the 'timestamp' column is properly recognized as a datetime object
-df_timestamp['timestamp'] = pd.to_datetime(df_timestamp['timestamp'], format='%Y-%m-%d %H:%M:%S', errors='coerce')
-
-# Filter out NaNs from the timestamp column
-df = df_timestamp[df_timestamp['timestamp'].notna()]
+# Load video data: rows with a valid timestamp sorted by time, parsed once per process
+video_filter = load_video_filter()
 
 # Sidebar user inputs
 st.sidebar.title("Data Filter")
 st.sidebar.write("Select a date range to filter videos")
 
 start_date = st.sidebar.date_input("Type or select start date", 
-                                   min_value=df['timestamp'].min().date(), 
-                                   max_value=df['timestamp'].max().date(),
-                                   value=df['timestamp'].min().date())
+                                   min_value=video_filter.min_date, 
+                                   max_value=video_filter.max_date,
+                                   value=video_filter.min_date)
 end_date = st.sidebar.date_input("Type or select end date", 
-                                 min_value=df['timestamp'].min().date(), 
-                                 max_value=df['timestamp'].max().date(),
-                                 value=df['timestamp'].max().date())
+                                 min_value=video_filter.min_date, 
+                                 max_value=video_filter.max_date,
+                                 value=video_filter.max_date)
 
-# Filter df based on user inputs
-filtered_df = df[(df['timestamp'] >= pd.to_datetime(start_date)) & 
-                 (df['timestamp'] <= pd.to_datetime(end_date))]
+# Filter by date: a slice of the time-sorted rows (the end date is included as a whole day)
+with timed('filter', page='videos'):
+    filtered_df = video_filter.take(video_filter.query(start_date, end_date))
 
-# Group by date and count occurrences
-occurrences = filtered_df['timestamp'].dt.date.value_counts().sort_index()
+# Count videos per day, week or month (depending on the span) from the precomputed rollup
+with timed('rollup', page='videos'):
+    dates, counts, granularity = load_video_rollup().counts(start_date, end_date)
 
 # Create a time series plot using Plotly Graph Objects
-fig = go.Figure(data=[go.Scatter(x=occurrences.index, y=occurrences.values, mode='lines+markers')])
+fig = go.Figure(data=[go.Scatter(x=dates, y=counts, mode='lines+markers')])
 fig.update_layout(
     title='Number Of Videos Over Selected Time Period',
-    xaxis_title='Date',
+    xaxis_title=f'Date (per {granularity})',
     yaxis_title='Count',
     xaxis=dict(tickformat='%Y-%m-%d'),
 )
-st.plotly_chart(fig, use_container_width=True)
+st.plotly_chart(fig, width='stretch')
 
 st.subheader(f"Videos from {start_date} to {end_date}")
 
-st.write(filtered_df[['new_file_name', 'timestamp', 'full_url']].sort_values(by='timestamp'))
+st.write(filtered_df[['new_file_name', 'timestamp', 'full_url']])
+
+# Zip the videos of the date range with a manifest
+export_panel(filtered_df, f"videos {start_date} {end_date}", key='videos')
 
 # Sidebar toggle to display selected videos 
 display_videos_on  = st.sidebar.checkbox('Display videos for selected time period')
 
-if display_videos_on:
-    # Display and play videos from URLs
-    for idx, row in filtered_df.iterrows():
+def video_caption(row, key):
+    caption = f"{row['new_file_name']} - Date: {row['timestamp']}"
+    if video_info is not None and key in video_info.index:
+        info = video_info.loc[key]
+        if not pd.isnull(info['duration']):
+            caption += f" - {info['duration']:.0f} s"
+        if not pd.isnull(info['codec']):
+            caption += f" - {info['codec']} {info['width']:.0f}x{info['height']:.0f}"
+    return caption
+
+video_info = load_video_info() if display_videos_on else None
+
+# Only one page of videos is laid out per run, like the image grids
+page_rows = filtered_df.iloc[:0]
+if display_videos_on and filtered_df.empty:
+    st.write("No videos in the selected time period.")
+elif display_videos_on:
+    pages = -(-len(filtered_df) // PAGE_SIZE)
+    page = 1
+    if pages > 1:
+        page = int(st.number_input(f"Page (1 - {pages})", min_value=1, max_value=pages,
+                                   value=1, step=1, key=f"video-page-{start_date}-{end_date}"))
+    start = (page - 1) * PAGE_SIZE
+    page_rows = filtered_df.iloc[start:start + PAGE_SIZE]
+    st.write(f"{len(filtered_df)} videos - showing {start + 1} to {start + len(page_rows)}")
+
+if display_videos_on and video_info is not None:
+    # Poster grid; a video's preview is only loaded once its button is clicked
+    num_columns = 3
+    columns = st.columns(num_columns)
+    for position, (idx, row) in enumerate(page_rows.iterrows()):
+        key = cache_key(row['original_file_name'])
+        column = columns[position % num_columns]
+        poster = poster_path(key)
+        if poster is not None:
+            with timed('render'):
+                column.image(str(poster), caption=video_caption(row, key), width='stretch')
+        else:
+            column.write(video_caption(row, key))
+        if column.button("Play preview", key=f"play-{key}"):
+            st.session_state['playing_video'] = key
+        if st.session_state.get('playing_video') == key:
+            preview = preview_path(key)
+            mirrored = local_copy(row['original_file_name'])
+            column.video(str(preview or mirrored or row['full_url']))
+        column.markdown(f"[Original file]({row['full_url']})")
+
+elif display_videos_on:
+    # No posters built yet (python -m app.helpers.video): embed the videos directly
+    for idx, row in page_rows.iterrows():
         video_url = row['full_url']  
+        key = cache_key(row['original_file_name'])
         st.write(f"{row['new_file_name']} - Date: {row['timestamp']}")
         st.write(f"URL: {video_url}")
 
+        # st.video reads a local file whole into server memory, so a mirrored copy is only embedded on click
+        mirrored = local_copy(row['original_file_name'])
+        if mirrored is not None:
+            if st.button("Play from the local mirror", key=f"play-{key}"):
+                st.session_state['playing_video'] = key
+            if st.session_state.get('playing_video') != key:
+                continue
+
         try:
             # Try displaying the video directly using st.video
-            st.video(video_url)
+            st.video(str(mirrored) if mirrored is not None else video_url)
         except Exception as e:
             # If st.video fails, fallback to multiple source formats
             st.write("Attempting to display using alternative formats")
@@ -0,0 +1 @@
+"""Reproducible benchmarks for the Streamlit pages (see ``python -m benchmarks.run --help``)."""
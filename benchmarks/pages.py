@@ -0,0 +1,216 @@
+"""Drive one page headlessly with Streamlit's ``AppTest`` and measure each interaction.
+
+Runs in its own process (started by ``benchmarks.run``), so the app's
+``ABBOTTABAD_*`` settings, the per-process memoized frames and the peak RSS
+all belong to a single page.  The fake release server runs in this process
+too, so the bytes it serves can be attributed to each interaction.
+
+Per interaction the result holds the rerun latency, the time the page spent
+in its ``filter`` stage (from the run's trace, see ``helpers.metrics``), the
+time until the first image reached Streamlit, the number of images shown, the requests and bytes
+served, the process's peak RSS so far and any exception the page raised.
+Bytes of the background prefetch land in whichever interaction is running
+when they are served.
+"""
+import argparse
+import datetime
+import json
+import sys
+import time
+from functools import partial
+from pathlib import Path
+
+APP_DIR = Path(__file__).resolve().parent.parent / 'app'
+
+# Generous per-run timeout: the largest datasets take a while on the first run
+RUN_TIMEOUT = 600
+
+
+def widget(elements, label):
+    """First widget whose label starts with ``label``."""
+    for element in elements:
+        if element.label.startswith(label):
+            return element
+    raise LookupError(f"no widget labelled {label!r}")
+
+
+def _narrow_dates(at, days):
+    start = widget(at.sidebar.date_input, "Type or select start date").value
+    widget(at.sidebar.date_input, "Type or select end date").set_value(start + datetime.timedelta(days=days))
+
+
+def _show_camera_makes(at):
+    widget(at.sidebar.checkbox, "Display camera").check()
+
+
+def _select_first_make(at):
+    makes = widget(at.sidebar.multiselect, "Select camera makes")
+    # Options are shown as "<make> (<count>)"; select() takes the make itself
+    makes.select(makes.options[0].rsplit(' (', 1)[0])
+
+
+def _show_videos(at):
+    # One week of videos, so the embed loop stays bounded on the large datasets
+    _narrow_dates(at, 7)
+    widget(at.sidebar.checkbox, "Display videos").check()
+
+
+def _loaders(page):
+    from helpers import data, rollups, score_index
+
+    return {
+        'classification': [data.load_images, score_index.load_score_index],
+        'insights': [data.load_image_metadata, rollups.load_image_rollup],
+        'videos': [data.load_videos, rollups.load_video_rollup],
+    }.get(page, [])
+
+
+# Page -> (script under app/, [(interaction, action on the AppTest before the rerun)])
+SCENARIOS = {
+    'hello': ('Hello.py', []),
+    'classification': ('pages/1_Image_Classification.py', [
+        ("threshold 0.5", lambda at: widget(at.sidebar.slider, "Select threshold").set_value(0.5)),
+        ("grid page 2", lambda at: widget(at.main.number_input, "Page").set_value(2)),
+        ("category 'mask'", lambda at: widget(at.sidebar.selectbox, "Select category").set_value('mask')),
+        ("rerun", None),
+    ]),
+    'insights': ('pages/2_Image_Insights.py', [
+        ("30 day range", partial(_narrow_dates, days=30)),
+        ("camera info on", _show_camera_makes),
+        ("one camera make", _select_first_make),
+        ("rerun", None),
+    ]),
+    'videos': ('pages/3_Demo_Video_Insights.py', [
+        ("30 day range", partial(_narrow_dates, days=30)),
+        ("display a week of videos", _show_videos),
+    ]),
+    'disclaimer': ('pages/4_CIA_Disclaimer.py', []),
+}
+
+
+class ImageProbe:
+    """Counts the images handed to Streamlit and when the first one arrived."""
+
+    def __init__(self):
+        self.started = self.first = None
+        self.images = 0
+
+    def reset(self):
+        self.started, self.first, self.images = time.perf_counter(), None, 0
+
+    def install(self):
+        import streamlit
+        from streamlit.delta_generator import DeltaGenerator
+
+        original = DeltaGenerator.image
+
+        def image(dg, *args, **kwargs):
+            if self.first is None:
+                self.first = time.perf_counter()
+            self.images += 1
+            return original(dg, *args, **kwargs)
+
+        # st.image is bound to the main container at import, so replace both
+        DeltaGenerator.image = image
+        streamlit.image = partial(image, streamlit._main)
+
+    @property
+    def time_to_first_image(self):
+        return None if self.first is None else self.first - self.started
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 1024 / (1024 if sys.platform == 'darwin' else 1)
+
+
+def stage_seconds(at, stage):
+    """Seconds the last run spent in ``stage``, from the trace the page's debug panel started."""
+    try:
+        trace = at.session_state['debug-trace']
+    except KeyError:
+        return None
+    times = trace.stages.get(stage)
+    return round(sum(times), 4) if times else None
+
+
+def run_page(page, server):
+    """Run ``page``'s scenario against ``server``; returns the page's result record."""
+    from streamlit.testing.v1 import AppTest
+
+    script, interactions = SCENARIOS[page]
+    loaders = _loaders(page)
+    started = time.perf_counter()
+    for load in loaders:
+        load()
+    data_load = time.perf_counter() - started
+
+    probe = ImageProbe()
+    probe.install()
+    at = AppTest.from_file(str(APP_DIR / script), default_timeout=RUN_TIMEOUT)
+    records = []
+    for name, action in [("initial load", None)] + interactions:
+        requests_before, bytes_before = server.counters()
+        error = None
+        if action is not None:
+            try:
+                action(at)
+            except LookupError as e:
+                error = str(e)
+        probe.reset()
+        at.run()
+        elapsed = time.perf_counter() - probe.started
+        requests_after, bytes_after = server.counters()
+        records.append({
+            'interaction': name,
+            'latency_s': round(elapsed, 4),
+            'filter_s': stage_seconds(at, 'filter'),
+            'time_to_first_image_s': None if probe.time_to_first_image is None
+            else round(probe.time_to_first_image, 4),
+            'images': probe.images,
+            'requests': requests_after - requests_before,
+            'bytes': bytes_after - bytes_before,
+            'peak_rss_mb': peak_rss_mb(),
+            'errors': [error] if error else [exception.message for exception in at.exception],
+        })
+    return {'page': page, 'data_load_s': round(data_load, 4), 'interactions': records}
+
+
+def prepare():
+    """Parse both CSVs and write their Parquet copies, as the first visitor would."""
+    from helpers import data
+
+    started = time.perf_counter()
+    data.load_images()
+    data.load_videos()
+    return {'prepare_s': round(time.perf_counter() - started, 4), 'peak_rss_mb': peak_rss_mb()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark one page (started by benchmarks.run).")
+    parser.add_argument('page', choices=[*SCENARIOS, 'prepare'])
+    parser.add_argument('--port', type=int, required=True, help="port the dataset URLs point at")
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds before each response")
+    parser.add_argument('--output', required=True, help="JSON file for the result")
+    args = parser.parse_args(argv)
+
+    # Pages import their helpers as ``helpers.*``, as under ``streamlit run app/Hello.py``
+    sys.path.insert(0, str(APP_DIR))
+    if args.page == 'prepare':
+        result = prepare()
+    else:
+        from .server import FakeReleaseServer
+
+        with FakeReleaseServer(args.port, args.latency) as server:
+            result = run_page(args.page, server)
+    # Not stdout: the pages and helpers may print progress there
+    Path(args.output).write_text(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
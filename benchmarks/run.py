@@ -0,0 +1,141 @@
+"""Benchmark every page at several dataset sizes and save the results as JSON.
+
+For each size a synthetic dataset is generated under ``benchmarks/.data/``
+(reused while its size and port match), its Parquet copies are built once,
+and then every page runs in a fresh process with an empty image cache and
+no mirror, so each run starts cold.  Image URLs point at a local
+``FakeReleaseServer`` with ``--latency`` seconds per response.
+
+Run from the repository root::
+
+    python -m benchmarks.run --rows 10000 100000 1000000 --latency 0.05
+
+Results go to ``benchmarks/results/<commit>-<time>.json``.  Pass
+``--compare <older results>`` to print the latency change per interaction.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from .pages import SCENARIOS
+from .synthetic import generate
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+ROOT = BENCHMARKS_DIR.parent
+DATA_ROOT = BENCHMARKS_DIR / '.data'
+RESULTS_DIR = BENCHMARKS_DIR / 'results'
+
+DEFAULT_ROWS = [10_000, 100_000, 1_000_000]
+DEFAULT_PORT = 8765
+# Videos are a small fraction of the release; keep the same ratio
+VIDEOS_PER_IMAGE = 0.1
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def dataset(rows, port, seed=0):
+    """Directory with a synthetic dataset of ``rows`` images, generated if missing."""
+    data_dir = DATA_ROOT / f'{rows}-{port}-{seed}'
+    if not (data_dir / 'df.csv').is_file() or not (data_dir / 'video_data.csv').is_file():
+        print(f"generating {rows} images in {data_dir}")
+        generate(data_dir, rows, max(1, int(rows * VIDEOS_PER_IMAGE)), f'http://127.0.0.1:{port}/', seed)
+    return data_dir
+
+
+def run_isolated(page, data_dir, port, latency):
+    """Run ``benchmarks.pages`` for one page in a fresh process with cold caches."""
+    with tempfile.TemporaryDirectory(prefix='abbottabad-bench-') as scratch:
+        env = dict(os.environ,
+                   ABBOTTABAD_DATA_DIR=str(data_dir),
+                   ABBOTTABAD_CACHE_DIR=str(Path(scratch) / 'cache'),
+                   ABBOTTABAD_MIRROR_DIR=str(Path(scratch) / 'mirror'))
+        output = Path(scratch) / 'result.json'
+        command = [sys.executable, '-m', 'benchmarks.pages', page, '--port', str(port),
+                   '--latency', str(latency), '--output', str(output)]
+        started = time.perf_counter()
+        completed = subprocess.run(command, cwd=ROOT, env=env, capture_output=True, text=True)
+        if completed.returncode != 0 or not output.is_file():
+            return {'page': page, 'error': completed.stderr.strip().splitlines()[-1:] or ['no result']}
+        result = json.loads(output.read_text())
+        result['process_s'] = round(time.perf_counter() - started, 4)
+        return result
+
+
+def compare(results, baseline):
+    """Print the latency of each interaction against ``baseline``."""
+    def latencies(run):
+        return {(size['rows'], page['page'], interaction['interaction']): interaction['latency_s']
+                for size in run['sizes'] for page in size['pages'] for interaction in page.get('interactions', [])}
+
+    before = latencies(baseline)
+    print(f"\nagainst {baseline.get('commit')} ({baseline.get('created')}):")
+    for key, latency in latencies(results).items():
+        if key in before and before[key]:
+            rows, page, interaction = key
+            print(f"{rows:>9} {page:<15} {interaction:<28} {before[key]:8.3f}s -> {latency:8.3f}s "
+                  f"({(latency / before[key] - 1) * 100:+.0f}%)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Streamlit pages on synthetic datasets.")
+    parser.add_argument('--rows', type=int, nargs='+', default=DEFAULT_ROWS, help="image rows per dataset")
+    parser.add_argument('--pages', nargs='+', choices=list(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument('--latency', type=float, default=0.05, help="fake server seconds per response")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="fake server port")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="results file (default: benchmarks/results/<commit>-<time>.json)")
+    parser.add_argument('--compare', help="earlier results file to compare against")
+    args = parser.parse_args(argv)
+
+    created = datetime.datetime.now().replace(microsecond=0)
+    results = {
+        'commit': git_commit(),
+        'created': created.isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'latency_s': args.latency,
+        'sizes': [],
+    }
+    for rows in args.rows:
+        data_dir = dataset(rows, args.port, args.seed)
+        size = {'rows': rows, 'prepare': run_isolated('prepare', data_dir, args.port, args.latency), 'pages': []}
+        for page in args.pages:
+            print(f"{rows} rows: {page}")
+            result = run_isolated(page, data_dir, args.port, args.latency)
+            size['pages'].append(result)
+            for interaction in result.get('interactions', []):
+                first_image = interaction['time_to_first_image_s']
+                filter_s = interaction.get('filter_s')
+                print(f"  {interaction['interaction']:<28} {interaction['latency_s']:8.3f}s, "
+                      f"filter {'-' if filter_s is None else f'{filter_s:.4f}s'}, "
+                      f"first image {'-' if first_image is None else f'{first_image:.3f}s'}, "
+                      f"{interaction['bytes'] / 1e6:.1f} MB, peak RSS {interaction['peak_rss_mb'] or 0:.0f} MB")
+            if 'error' in result:
+                print(f"  failed: {result['error']}")
+        results['sizes'].append(size)
+
+    output = Path(args.output) if args.output else \
+        RESULTS_DIR / f"{results['commit'] or 'unknown'}-{created:%Y%m%d-%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"results written to {output}")
+    if args.compare:
+        compare(results, json.loads(Path(args.compare).read_text()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,99 @@
+"""Local stand-in for the release host, with configurable latency.
+
+Any ``*.jpg``/``*.png`` path returns one of a few pre-rendered photo-sized
+JPEGs (picked by the path, so a URL always gets the same bytes); other paths
+return a small binary body as a video.  Each response waits ``latency``
+seconds first, like a distant server.  The server counts requests and body
+bytes so benchmarks can report the transfer per interaction.
+"""
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+
+import numpy as np
+
+IMAGE_SIZE = (1600, 1200)
+IMAGE_VARIANTS = 8
+VIDEO_BYTES = 256 * 1024
+
+
+def render_images(count=IMAGE_VARIANTS, size=IMAGE_SIZE, seed=0):
+    """Smooth random JPEGs that compress like photos (roughly 300 KB each)."""
+    from PIL import Image
+
+    rng = np.random.default_rng(seed)
+    images = []
+    for _ in range(count):
+        coarse = rng.integers(0, 256, (12, 16, 3), dtype=np.uint8)
+        image = Image.fromarray(coarse).resize(size, Image.BICUBIC)
+        detail = rng.normal(0, 6, (size[1], size[0], 3))
+        pixels = np.clip(np.asarray(image, dtype=np.float64) + detail, 0, 255).astype(np.uint8)
+        buffer = BytesIO()
+        Image.fromarray(pixels).save(buffer, 'JPEG', quality=85)
+        images.append(buffer.getvalue())
+    return images
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        server = self.server
+        time.sleep(server.latency)
+        path = self.path.split('?', 1)[0]
+        if path.lower().endswith(('.jpg', '.jpeg', '.png')):
+            body = server.images[zlib.crc32(path.encode()) % len(server.images)]
+            content_type = 'image/jpeg'
+        else:
+            body = server.video
+            content_type = 'video/3gpp'
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        server.record(len(body))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeReleaseServer(ThreadingHTTPServer):
+    """Threaded HTTP server on ``127.0.0.1:port``; use as a context manager."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, port=0, latency=0.0, images=None):
+        super().__init__(('127.0.0.1', port), _Handler)
+        self.latency = latency
+        self.images = images or render_images()
+        self.video = np.random.default_rng(1).integers(0, 256, VIDEO_BYTES, dtype=np.uint8).tobytes()
+        self.requests = 0
+        self.bytes_sent = 0
+        self._counter_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}/'
+
+    def record(self, size):
+        with self._counter_lock:
+            self.requests += 1
+            self.bytes_sent += size
+
+    def counters(self):
+        with self._counter_lock:
+            return self.requests, self.bytes_sent
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+        self.server_close()
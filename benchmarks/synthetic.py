@@ -0,0 +1,116 @@
+"""Synthetic ``df.csv`` and ``video_data.csv`` with the layout of the real release.
+
+Rows get release style names (``<MD5>_<name>``), URLs under ``base_url``
+mirroring the release paths, EXIF style timestamps with gaps, raw camera
+make spellings and one score column per category, so every page exercises
+the same code paths as with the real data.  Generation is seeded and
+vectorized; a million image rows take well under a minute.
+"""
+import hashlib
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+CATEGORIES = [
+    'airplane', 'animal', 'beach', 'book', 'building', 'car', 'cartoon', 'child', 'computer', 'crowd',
+    'desert', 'document', 'eye', 'face', 'flag', 'food', 'forest', 'gun', 'helicopter', 'map',
+    'mask', 'money', 'mosque', 'mountain', 'phone', 'screenshot', 'soldier', 'text', 'video game', 'weapon',
+]
+
+# Raw EXIF spellings, weighted roughly like a phone and compact camera collection
+MAKES = {
+    'Canon': ['Canon PowerShot A480', 'Canon DIGITAL IXUS 80 IS', 'Canon EOS 400D DIGITAL'],
+    'NIKON CORPORATION': ['NIKON D40', 'COOLPIX S210'],
+    'SONY': ['DSC-W55', 'DSC-S730'],
+    'Sony Ericsson': ['K800i', 'W810i'],
+    'Nokia': ['N95', '6300', 'N73'],
+    'SAMSUNG': ['SGH-E250'],
+    'OLYMPUS IMAGING CORP.': ['FE190/X750'],
+    'EASTMAN KODAK COMPANY': ['KODAK EASYSHARE C140 DIGITAL CAMERA'],
+    'Acme Optical': ['Model 1'],
+}
+MAKE_WEIGHTS = [0.2, 0.15, 0.15, 0.1, 0.15, 0.08, 0.07, 0.05, 0.05]
+
+# Metadata columns before the scores (df.csv has 15, see helpers.data.SCORE_COLUMNS_START)
+IMAGE_COLUMNS = ['new_file_name', 'original_file_name', 'full_url', 'timestamp', 'camera_make', 'camera_model',
+                 'file_type', 'file_size', 'width', 'height', 'orientation', 'software', 'flash',
+                 'exposure_time', 'focal_length']
+
+START = np.datetime64('2005-01-01T00:00:00')
+END = np.datetime64('2011-05-01T00:00:00')
+
+
+def _release_names(rows, prefix, extension, rng):
+    names = np.char.add(np.char.add(prefix, np.arange(rows).astype(str)), extension)
+    # The release prefixes every file with the MD5 of its content; any 32 hex digits will do here
+    salt = rng.integers(0, 2 ** 32)
+    hashes = np.array([hashlib.md5(f'{salt}-{position}'.encode()).hexdigest().upper() for position in range(rows)])
+    originals = np.char.add(np.char.add(hashes, '_'), names)
+    return names, hashes, originals
+
+
+def _timestamps(rows, rng, missing=0.0):
+    seconds = (END - START).astype('timedelta64[s]').astype(np.int64)
+    stamps = pd.Series(START + rng.integers(0, seconds, rows).astype('timedelta64[s]'))
+    if missing:
+        stamps[rng.random(rows) < missing] = pd.NaT
+    return stamps
+
+
+def image_frame(rows, base_url, seed=0):
+    """``rows`` synthetic images in the ``df.csv`` layout, URLs under ``base_url``."""
+    rng = np.random.default_rng(seed)
+    names, hashes, originals = _release_names(rows, 'IMG_', '.jpg', rng)
+    base_url = base_url.rstrip('/') + '/'
+    urls = np.char.add(np.char.add(np.char.add(base_url, hashes.astype('U2')), '/'), originals)
+
+    makes = np.array(list(MAKES))[rng.choice(len(MAKES), rows, p=MAKE_WEIGHTS)]
+    models = np.array([MAKES[make][position % len(MAKES[make])]
+                       for make, position in zip(makes.tolist(), rng.integers(0, 3, rows).tolist())])
+    has_camera = rng.random(rows) < 0.6
+    frame = pd.DataFrame({
+        'new_file_name': names,
+        'original_file_name': originals,
+        'full_url': urls,
+        'timestamp': _timestamps(rows, rng, missing=0.3).dt.strftime('%Y:%m:%d %H:%M:%S'),
+        'camera_make': pd.Series(makes).where(has_camera),
+        'camera_model': pd.Series(models).where(has_camera),
+        'file_type': 'JPEG',
+        'file_size': rng.integers(20_000, 3_000_000, rows),
+        'width': 1600,
+        'height': 1200,
+        'orientation': 1,
+        'software': None,
+        'flash': rng.integers(0, 2, rows),
+        'exposure_time': '1/60',
+        'focal_length': 6.2,
+    }, columns=IMAGE_COLUMNS)
+    # CLIP style scores: mostly low, with a long tail of confident matches
+    scores = rng.beta(0.6, 4.0, (rows, len(CATEGORIES))).round(4)
+    return pd.concat([frame, pd.DataFrame(scores, columns=CATEGORIES)], axis=1)
+
+
+def video_frame(rows, base_url, seed=0):
+    """``rows`` synthetic videos in the ``video_data.csv`` layout, URLs under ``base_url``."""
+    rng = np.random.default_rng(seed + 1)
+    names, hashes, originals = _release_names(rows, 'Video', '.3gp', rng)
+    base_url = base_url.rstrip('/') + '/'
+    urls = np.char.add(np.char.add(np.char.add(base_url, hashes.astype('U2')), '/'), originals)
+    return pd.DataFrame({
+        'new_file_name': names,
+        'original_file_name': originals,
+        'full_url': urls,
+        'timestamp': _timestamps(rows, rng).dt.strftime('%Y-%m-%d %H:%M:%S'),
+    })
+
+
+def generate(data_dir, image_rows, video_rows, base_url, seed=0):
+    """Write ``df.csv`` and ``video_data.csv`` into ``data_dir`` (created if needed)."""
+    data_dir = Path(data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+    for stale in data_dir.glob('*.parquet'):
+        stale.unlink()
+    image_frame(image_rows, base_url, seed).to_csv(data_dir / 'df.csv', index=False)
+    video_frame(video_rows, base_url, seed).to_csv(data_dir / 'video_data.csv', index=False)
+    return data_dir
@@ -0,0 +1,130 @@
+"""State machine of the per-host circuit breaker in ``helpers.client``."""
+import threading
+import time
+
+import pytest
+import requests
+
+from app.helpers.client import CircuitBreaker, CircuitOpenError, DeadlineExceeded, HttpClient
+
+URL = "http://release.example/00/0123456789ABCDEF0123456789ABCDEF_image.jpg"
+
+
+class FakeSession:
+    """Stands in for ``requests.Session``: each ``get`` pops the next outcome."""
+
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    def get(self, url, timeout=None, **kwargs):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, BaseException):
+            raise outcome
+        response = requests.Response()
+        response.status_code = outcome
+        return response
+
+
+def make_client(*outcomes, failure_threshold=1, reset_after=0.05):
+    client = HttpClient(retries=0, backoff=0, failure_threshold=failure_threshold, reset_after=reset_after)
+    client.session = FakeSession(*outcomes)
+    return client
+
+
+def test_opens_after_threshold_and_fails_fast():
+    breaker = CircuitBreaker(failure_threshold=2, reset_after=60)
+    breaker.record_failure()
+    assert breaker.allow() and not breaker.is_open
+    breaker.record_failure()
+    assert breaker.is_open and not breaker.allow()
+
+
+def test_success_resets_the_failure_count():
+    breaker = CircuitBreaker(failure_threshold=2, reset_after=60)
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert not breaker.is_open
+
+
+def test_one_trial_after_reset_then_closes_on_success():
+    breaker = CircuitBreaker(failure_threshold=1, reset_after=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+    assert not breaker.allow()  # a single trial at a time
+    breaker.record_success()
+    assert not breaker.is_open and breaker.allow()
+
+
+def test_failed_trial_reopens():
+    breaker = CircuitBreaker(failure_threshold=5, reset_after=0.01)
+    for _ in range(5):
+        breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.is_open and not breaker.allow()
+    time.sleep(0.02)
+    assert breaker.allow()
+
+
+def test_release_only_frees_the_callers_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_after=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    assert breaker.allow()
+
+    other = threading.Thread(target=breaker.release)
+    other.start()
+    other.join()
+    assert not breaker.allow()
+
+    breaker.release()
+    assert breaker.allow()
+
+
+def test_truncated_trial_response_does_not_wedge_the_breaker():
+    client = make_client(requests.ConnectionError("refused"),
+                         requests.exceptions.ChunkedEncodingError("truncated"), 200)
+    with pytest.raises(requests.ConnectionError):
+        client.get(URL)
+    time.sleep(0.06)
+    with pytest.raises(requests.exceptions.ChunkedEncodingError):
+        client.get(URL)
+    assert client.breaker(URL).is_open
+    time.sleep(0.06)
+    assert client.get(URL).status_code == 200
+    assert not client.breaker(URL).is_open
+    assert client.session.calls == 3
+
+
+def test_unexpected_error_releases_the_trial():
+    client = make_client(requests.ConnectionError("refused"), requests.exceptions.InvalidURL("bad"), 200)
+    with pytest.raises(requests.ConnectionError):
+        client.get(URL)
+    time.sleep(0.06)
+    with pytest.raises(requests.exceptions.InvalidURL):
+        client.get(URL)
+    assert client.get(URL).status_code == 200
+
+
+def test_open_breaker_makes_no_request():
+    client = make_client(requests.ConnectionError("refused"), reset_after=60)
+    with pytest.raises(requests.ConnectionError):
+        client.get(URL)
+    with pytest.raises(CircuitOpenError):
+        client.get(URL)
+    assert client.session.calls == 1
+
+
+def test_deadline_during_trial_gives_the_slot_back():
+    client = make_client(requests.ConnectionError("refused"), 200)
+    with pytest.raises(requests.ConnectionError):
+        client.get(URL)
+    time.sleep(0.06)
+    with pytest.raises(DeadlineExceeded):
+        client.get(URL, deadline=time.monotonic() - 1)
+    assert client.get(URL).status_code == 200
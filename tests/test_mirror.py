@@ -0,0 +1,140 @@
+"""Sync, resume and verification of ``helpers.mirror`` against a local ``http.server``."""
+import functools
+import hashlib
+import re
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from app.helpers.cache import cache_key
+from app.helpers.mirror import Manifest, mirror_path, sync
+
+CONTENTS = [b"first image " * 1000, b"second image " * 3000]
+
+
+class ReleaseHandler(SimpleHTTPRequestHandler):
+    """Serves the release directory, answering ``Range`` requests when the server allows them."""
+
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get('Range')))
+        match = re.fullmatch(r"bytes=(\d+)-", self.headers.get('Range', ''))
+        if not (self.server.ranges and match):
+            return super().do_GET()
+        with open(self.translate_path(self.path), 'rb') as file:
+            body = file.read()
+        start = int(match[1])
+        if start >= len(body):
+            self.send_response(416)
+            self.send_header('Content-Range', f"bytes */{len(body)}")
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(206)
+        self.send_header('Content-Range', f"bytes {start}-{len(body) - 1}/{len(body)}")
+        self.send_header('Content-Length', str(len(body) - start))
+        self.end_headers()
+        self.wfile.write(body[start:])
+
+    def send_response(self, code, message=None):
+        self.server.statuses.append(code)
+        super().send_response(code, message)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def release(tmp_path):
+    """A local release host: ``(server, records)`` for files named after the MD5 of their content."""
+    served = tmp_path / 'release'
+    served.mkdir()
+    records = []
+    for number, content in enumerate(CONTENTS):
+        file_name = f"{hashlib.md5(content).hexdigest().upper()}_image{number}.jpg"
+        (served / file_name).write_bytes(content)
+        records.append((cache_key(file_name), file_name, file_name))
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(ReleaseHandler, directory=str(served)))
+    server.requests = []
+    server.statuses = []
+    server.ranges = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/"
+    yield server, [(key, file_name, base_url + url) for key, file_name, url in records]
+    server.shutdown()
+    server.server_close()
+
+
+def test_clean_sync(release, tmp_path):
+    server, records = release
+    root = tmp_path / 'mirror'
+    assert sync(records, root, workers=2) == (2, 0)
+    for (key, file_name, _), content in zip(records, CONTENTS):
+        assert mirror_path(key, root).read_bytes() == content
+        assert Manifest(root).entries[key]['file_name'] == file_name
+    assert not list(root.rglob('*.part'))
+
+
+def test_second_run_skips_manifest_entries(release, tmp_path):
+    server, records = release
+    root = tmp_path / 'mirror'
+    sync(records, root, workers=2)
+    server.requests.clear()
+    assert sync(records, root, workers=2) == (0, 0)
+    assert server.requests == []
+
+
+def test_missing_file_is_downloaded_again(release, tmp_path):
+    server, records = release
+    root = tmp_path / 'mirror'
+    sync(records, root, workers=2)
+    mirror_path(records[0][0], root).unlink()
+    server.requests.clear()
+    assert sync(records, root, workers=2) == (1, 0)
+    assert len(server.requests) == 1
+
+
+@pytest.mark.parametrize('ranges, sent', [(True, 206), (False, 200)])
+def test_resume_from_part_file(release, tmp_path, ranges, sent):
+    server, records = release
+    server.ranges = ranges
+    root = tmp_path / 'mirror'
+    key, file_name, _ = records[1]
+    final = mirror_path(key, root)
+    final.parent.mkdir(parents=True)
+    offset = len(CONTENTS[1]) // 3
+    final.with_name(final.name + '.part').write_bytes(CONTENTS[1][:offset])
+
+    assert sync(records[1:], root, workers=1) == (1, 0)
+    assert server.requests == [(f"/{file_name}", f"bytes={offset}-")]
+    assert server.statuses == [sent]
+    # 206 appends the rest, a server ignoring the range resends the whole file
+    assert final.read_bytes() == CONTENTS[1]
+
+
+def test_complete_part_file_is_kept_on_416(release, tmp_path):
+    server, records = release
+    root = tmp_path / 'mirror'
+    key, _, _ = records[0]
+    final = mirror_path(key, root)
+    final.parent.mkdir(parents=True)
+    final.with_name(final.name + '.part').write_bytes(CONTENTS[0])
+
+    assert sync(records[:1], root, workers=1) == (1, 0)
+    assert server.statuses == [416]
+    assert final.read_bytes() == CONTENTS[0]
+
+
+def test_checksum_mismatch_discards_the_download(release, tmp_path):
+    server, records = release
+    root = tmp_path / 'mirror'
+    _, file_name, url = records[0]
+    # The name claims a hash the served content does not have
+    wrong_key = 'F' * 32
+    assert sync([(wrong_key, file_name, url)], root, workers=1) == (0, 1)
+    final = mirror_path(wrong_key, root)
+    assert not final.exists()
+    assert not final.with_name(final.name + '.part').exists()
+    assert wrong_key not in Manifest(root).entries